@@ -0,0 +1,144 @@
+"""AgentExecutor that respects the request deadline and token budget, answering best-effort when either runs out."""
+
+from typing import Any, Dict, List, Optional, Tuple, Union
+from langchain.agents import AgentExecutor
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.callbacks import AsyncCallbackManagerForChainRun, CallbackManagerForChainRun
+from langchain_core.tools import BaseTool
+from llm.token_usage import get_usage_context, token_ledger
+from utils.deadline import DeadlineExceeded, get_current_deadline
+
+
+# Characters of each observation quoted in a best-effort answer
+BEST_EFFORT_OBSERVATION_CHARS = 600
+
+
+class BudgetedAgentExecutor(AgentExecutor):
+    """
+    AgentExecutor that stops before an iteration that would overrun the deadline or token budget.
+
+    Before each iteration the executor compares the time left on the current
+    request deadline with the expected cost of an iteration, and checks the
+    session's token budget. When the iteration cannot fit, the budget is
+    spent, or the iteration limit is hit, the stock "Agent stopped" message
+    is replaced with a best-effort Final Answer built from the observations
+    gathered so far, without spending another LLM call. The same happens when
+    the deadline runs out during an iteration, e.g. while an LLM call waits
+    for its rate-limit slot.
+    """
+
+    def _should_continue(self, iterations: int, time_elapsed: float) -> bool:
+        deadline = get_current_deadline()
+        if deadline is not None and iterations > 0:
+            deadline.mark_iteration()
+        # LLM calls of the coming iteration are attributed to it in the token ledger
+        usage = get_usage_context()
+        if usage is not None:
+            usage.iteration = iterations
+        if not super()._should_continue(iterations, time_elapsed):
+            if deadline is not None:
+                deadline.best_effort = True
+            return False
+        # Always attempt the first iteration; afterwards only if another one fits
+        if deadline is not None and (deadline.expired or (iterations > 0 and not deadline.can_fit_iteration())):
+            deadline.best_effort = True
+            return False
+        if usage is not None and iterations > 0:
+            remaining_tokens = token_ledger.remaining_budget(usage.session_id)
+            if remaining_tokens is not None and remaining_tokens <= 0:
+                if deadline is not None:
+                    deadline.best_effort = True
+                return False
+        return True
+
+    def _take_next_step(
+        self,
+        name_to_tool_map: Dict[str, BaseTool],
+        color_mapping: Dict[str, str],
+        inputs: Dict[str, str],
+        intermediate_steps: List[Tuple[AgentAction, str]],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Union[AgentFinish, List[Tuple[AgentAction, str]]]:
+        try:
+            return super()._take_next_step(
+                name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=run_manager
+            )
+        except DeadlineExceeded as e:
+            return self._stop_at_deadline(e, intermediate_steps)
+
+    async def _atake_next_step(
+        self,
+        name_to_tool_map: Dict[str, BaseTool],
+        color_mapping: Dict[str, str],
+        inputs: Dict[str, str],
+        intermediate_steps: List[Tuple[AgentAction, str]],
+        run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+    ) -> Union[AgentFinish, List[Tuple[AgentAction, str]]]:
+        try:
+            return await super()._atake_next_step(
+                name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=run_manager
+            )
+        except DeadlineExceeded as e:
+            return self._stop_at_deadline(e, intermediate_steps)
+
+    @staticmethod
+    def _stop_at_deadline(
+        error: DeadlineExceeded,
+        intermediate_steps: List[Tuple[AgentAction, str]]
+    ) -> AgentFinish:
+        """Finish the run with a best-effort answer when the deadline ran out mid-iteration."""
+        deadline = get_current_deadline()
+        if deadline is not None:
+            deadline.best_effort = True
+        return AgentFinish({"output": best_effort_answer(intermediate_steps)}, f"Stopped: {error}")
+
+    def _return(
+        self,
+        output: AgentFinish,
+        intermediate_steps: List[Tuple[AgentAction, str]],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        output = self._best_effort_output(output, intermediate_steps)
+        return super()._return(output, intermediate_steps, run_manager=run_manager)
+
+    async def _areturn(
+        self,
+        output: AgentFinish,
+        intermediate_steps: List[Tuple[AgentAction, str]],
+        run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        output = self._best_effort_output(output, intermediate_steps)
+        return await super()._areturn(output, intermediate_steps, run_manager=run_manager)
+
+    @staticmethod
+    def _best_effort_output(
+        output: AgentFinish,
+        intermediate_steps: List[Tuple[AgentAction, str]]
+    ) -> AgentFinish:
+        """Replace the output with a best-effort answer when the run was cut short."""
+        deadline = get_current_deadline()
+        if deadline is None or not deadline.best_effort:
+            return output
+        return AgentFinish({"output": best_effort_answer(intermediate_steps)}, output.log)
+
+
+def best_effort_answer(intermediate_steps: List[Tuple[AgentAction, str]]) -> str:
+    """Compose an answer from the tool observations gathered so far."""
+    findings = []
+    seen = set()
+    for action, observation in intermediate_steps:
+        text = str(observation).strip()
+        key = (action.tool, str(action.tool_input))
+        if not text or action.tool == "_Exception" or key in seen:
+            continue
+        seen.add(key)
+        if len(text) > BEST_EFFORT_OBSERVATION_CHARS:
+            text = text[:BEST_EFFORT_OBSERVATION_CHARS].rstrip() + "..."
+        findings.append(f"From {action.tool} ({action.tool_input}):\n{text}")
+
+    if not findings:
+        return "Sorry, I couldn't finish answering within the available time, steps or token budget. Please try again."
+    return (
+        "I couldn't finish working through this, but here is what I found so far:\n\n"
+        + "\n\n".join(findings)
+    )
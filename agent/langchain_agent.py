@@ -1,61 +1,160 @@
 """LangChain agent implementation using custom Gemini LLM with conversation memory."""
 
-from typing import List, Optional
-from langchain.agents import AgentExecutor, create_react_agent
+import contextvars
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Sequence
+from langchain.agents import create_react_agent
 from langchain_core.prompts import PromptTemplate
 from langchain.memory import ConversationBufferMemory
+from langchain_core.agents import AgentAction
 from langchain_core.messages import HumanMessage, AIMessage
-from llm.langchain_adapter import LangChainGeminiAdapter
-from tools.langchain_tools import LANGCHAIN_TOOLS
+from langchain_core.tools import BaseTool
+from llm.langchain_adapter import LangChainGeminiAdapter, llm_async_flight
+from llm.token_usage import estimate_tokens, token_ledger, usage_scope
+from tools.langchain_tools import LANGCHAIN_TOOLS, PREFETCH_TOOLS, tool_cache, tool_flight, wikipedia_tool
+from tools.resilience import get_resilience_stats
+from utils.cassette import Cassette
+from utils.deadline import Deadline
 from prompts.agent_prompts import REACT_AGENT_PROMPT
+from .executor import BudgetedAgentExecutor
+from .long_term_memory import LongTermMemory
+from .output_parser import IncrementalReActParser, RobustReActOutputParser
+from .tool_selector import DEFAULT_TOP_K, ToolSelector
+
+
+# Share of a session's remaining token budget that resent history may take per question
+HISTORY_BUDGET_SHARE = 0.5
+
+# Parser for the tools offered to the question being answered
+_offered_parser: contextvars.ContextVar = contextvars.ContextVar("offered_parser", default=None)
 
 
 class LangChainAgent:
     """Q&A agent using LangChain with custom Gemini LLM and conversation memory."""
     
-    def __init__(self, gemini_api_key: str):
-        """Initialize the LangChain agent with conversation memory."""
+    MAX_ITERATIONS = 2
+    
+    def __init__(
+        self,
+        gemini_api_key: str,
+        cassette: Optional[Cassette] = None,
+        verbose: bool = True,
+        request_deadline_s: Optional[float] = None,
+        token_budget: Optional[int] = None,
+        tool_top_k: Optional[int] = DEFAULT_TOP_K,
+        long_term_memory: bool = False
+    ):
+        """
+        Initialize the LangChain agent with conversation memory.
+        
+        Args:
+            gemini_api_key: Gemini API key
+            cassette: Optional cassette recording (or replaying) this agent's LLM traffic
+            verbose: Print ReAct traces
+            request_deadline_s: Default end-to-end latency budget per question (None = unlimited)
+            token_budget: Input plus output tokens allowed per conversation (None = unlimited)
+            tool_top_k: Tools offered per question besides web_search (None = always all tools)
+            long_term_memory: Send recent plus recalled relevant exchanges instead of the whole history
+        """
+        self.session_id = uuid.uuid4().hex
+        self.cassette = cassette
+        self.request_deadline_s = request_deadline_s
+        self.token_budget = token_budget
+        self.tool_top_k = tool_top_k
+        self.long_term_memory = long_term_memory
+        token_ledger.set_budget(self.session_id, token_budget)
+        self.last_budget_report: Optional[Dict[str, Any]] = None
+        self.trimmed_messages = 0
+        self.verbose = verbose
+        
         # Create custom LLM adapter
-        self.llm = LangChainGeminiAdapter(api_key=gemini_api_key)
+        self.llm = LangChainGeminiAdapter(api_key=gemini_api_key, cassette=cassette)
         
         # Initialize conversation memory
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True,
-            output_key="output"
-        )
+        if long_term_memory:
+            self.memory = LongTermMemory(
+                memory_key="chat_history",
+                return_messages=True,
+                output_key="output",
+                session_id=self.session_id
+            )
+        else:
+            self.memory = ConversationBufferMemory(
+                memory_key="chat_history",
+                return_messages=True,
+                output_key="output"
+            )
         
         # Use centralized prompt from prompts directory
         self.prompt = REACT_AGENT_PROMPT
         
-        # Create ReAct agent
-        self.agent = create_react_agent(
-            llm=self.llm,
-            tools=LANGCHAIN_TOOLS,
-            prompt=self.prompt
+        # Salvage malformed responses instead of spending an iteration on them
+        self.output_parser = RobustReActOutputParser(
+            tool_names=[tool.name for tool in LANGCHAIN_TOOLS],
+            no_input_tools=[tool.name for tool in LANGCHAIN_TOOLS if not _requires_input(tool)]
         )
+        # Guessed or unparseable steps from the fast routing model, and calls to
+        # tools the question was not offered, escalate to the stronger one
+        self.llm.output_validator = lambda text: self._current_parser().escalation_reason(text)
         
-        # Create agent executor with memory and better error handling
-        self.agent_executor = AgentExecutor(
-            agent=self.agent,
-            tools=LANGCHAIN_TOOLS,
-            memory=self.memory,
-            verbose=True,
-            handle_parsing_errors="Check your output and make sure it conforms to the expected format. Only provide ONE action per response, never both Action and Final Answer together.",
-            max_iterations=2,
-            return_intermediate_steps=False
-        )
+        # Stream each step: stop generating once the action is complete and start shared tools right away
+        self._tools_by_name = {tool.name: tool for tool in LANGCHAIN_TOOLS}
+        self._dispatch_lock = threading.Lock()
+        self._dispatch_stats = {"early_actions": 0, "prefetched": 0}
+        self.llm.chunk_handler_factory = lambda: IncrementalReActParser(
+            self._current_parser(), on_action=self._dispatch_early
+        ).feed
+        
+        # Only the tools relevant to a question are rendered into its prompt;
+        # one agent, executor and parser is built per tool subset and reused
+        self.tool_selector = ToolSelector(LANGCHAIN_TOOLS, top_k=tool_top_k) if tool_top_k is not None else None
+        self._executors: Dict[FrozenSet[str], BudgetedAgentExecutor] = {}
+        self._parsers: Dict[FrozenSet[str], RobustReActOutputParser] = {}
+        
+        # Agent executor over all tools
+        self.agent_executor = self._executor_for(LANGCHAIN_TOOLS)
+        self.agent = self.agent_executor.agent
+        self._record_session()
     
     def init_conversation(self) -> None:
         """Initialize a new conversation by clearing memory."""
         self.memory.clear()
+        self._start_session()
         print("🧠 Conversation history initialized (memory cleared)")
     
     def end_conversation(self) -> None:
         """End the conversation by clearing memory."""
         self.memory.clear()
+        self._start_session()
         print("🧠 Conversation history cleared")
     
+    def _start_session(self) -> None:
+        """Drop the finished session's token usage from the ledger and start a new session."""
+        token_ledger.clear_session(self.session_id)
+        self.session_id = uuid.uuid4().hex
+        token_ledger.set_budget(self.session_id, self.token_budget)
+        if isinstance(self.memory, LongTermMemory):
+            self.memory.session_id = self.session_id
+        self._record_session()
+    
+    def get_settings(self) -> Dict[str, Any]:
+        """Get the constructor settings that shape this agent's prompts and limits."""
+        return {
+            "request_deadline_s": self.request_deadline_s,
+            "token_budget": self.token_budget,
+            "tool_top_k": self.tool_top_k,
+            "long_term_memory": self.long_term_memory,
+        }
+    
+    def _record_session(self) -> None:
+        """Record the session's settings, so replay rebuilds an agent that sends the same prompts."""
+        if self.cassette is not None:
+            self.cassette.record_event(
+                "session", {"session": self.session_id, "settings": self.get_settings()}
+            )
+    
     def get_conversation_history(self) -> List[str]:
         """Get the current conversation history as a list of strings."""
         messages = self.memory.chat_memory.messages
@@ -80,10 +179,187 @@ class LangChainAgent:
             print(f"  {entry}")
         print("-" * 40)
     
-    def answer_question(self, question: str) -> str:
-        """Answer a question using the LangChain agent with memory."""
+    def get_performance_stats(self) -> Dict[str, Any]:
+        """Get runtime statistics from the agent's components."""
+        stats = {
+            "output_parser": self.output_parser.get_stats(),
+            "llm_single_flight": self.llm.custom_llm.get_flight_stats(),
+            "llm_async_single_flight": llm_async_flight.get_stats(),
+            "llm_cache": self.llm.custom_llm.get_cache_stats(),
+            "model_cascade": self.llm.custom_llm.get_cascade_stats(),
+            "llm_scheduler": self.llm.custom_llm.get_scheduler_stats(),
+            "tool_single_flight": tool_flight.get_stats(),
+            "tool_cache": tool_cache.get_stats(),
+            "tool_resilience": get_resilience_stats(LANGCHAIN_TOOLS),
+            "token_usage": self.get_token_totals(),
+            "early_dispatch": self._get_dispatch_stats(),
+        }
+        if self.tool_selector is not None:
+            stats["tool_selection"] = self.tool_selector.get_stats()
+        if isinstance(self.memory, LongTermMemory):
+            stats["long_term_memory"] = self.memory.get_stats()
+        if self.last_budget_report is not None:
+            stats["last_request_budget"] = self.last_budget_report
+        if wikipedia_tool.local_index is not None:
+            stats["wikipedia_index"] = wikipedia_tool.local_index.get_stats()
+        if self.cassette is not None:
+            stats["cassette"] = self.cassette.get_stats()
+        return stats
+    
+    def get_token_totals(self) -> Dict[str, Any]:
+        """Get this conversation's token totals and budget."""
+        totals = token_ledger.session_usage(self.session_id)
+        totals["budget"] = self.token_budget
+        totals["remaining"] = token_ledger.remaining_budget(self.session_id)
+        totals["trimmed_messages"] = self.trimmed_messages
+        return totals
+    
+    def get_token_usage(self, group_by: tuple = ("iteration",)) -> List[Dict[str, Any]]:
+        """
+        Get this conversation's token usage.
+    
+        Args:
+            group_by: Any of 'method', 'model', 'stage' and 'iteration'
+    
+        Returns:
+            One row per group with calls, input/output tokens and input tokens
+            per prompt section (history, tools, instructions, question, scratchpad)
+        """
+        return token_ledger.query(session_id=self.session_id, group_by=group_by)
+    
+    def answer_question(self, question: str, deadline_s: Optional[float] = None) -> str:
+        """
+        Answer a question using the LangChain agent with memory.
+        
+        Args:
+            question: User question
+            deadline_s: End-to-end latency budget in seconds (defaults to request_deadline_s)
+            
+        Returns:
+            The agent's answer, best-effort if the deadline cut the ReAct loop short
+        """
+        if self.cassette is not None:
+            self.cassette.record_event(
+                "question", {"session": self.session_id, "question": question}
+            )
+        remaining_tokens = token_ledger.remaining_budget(self.session_id)
+        if remaining_tokens is not None:
+            if remaining_tokens <= 0:
+                return "Sorry, this conversation has used up its token budget. Please start a new conversation."
+            self._trim_history(remaining_tokens)
+        deadline = Deadline(deadline_s if deadline_s is not None else self.request_deadline_s)
         try:
-            response = self.agent_executor.invoke({"input": question})
+            executor = self._select_executor(question)
+            with deadline.activate(), usage_scope(self.session_id), self._offering(executor):
+                response = executor.invoke({"input": question})
             return response["output"]
         except Exception as e:
-            return f"Sorry, I encountered an error: {str(e)}" 
\ No newline at end of file
+            return f"Sorry, I encountered an error: {str(e)}"
+        finally:
+            self.last_budget_report = deadline.report()
+    
+    def _select_executor(self, question: str) -> BudgetedAgentExecutor:
+        """Get the executor whose prompt offers only the tools relevant to a question."""
+        if self.tool_selector is None:
+            return self.agent_executor
+        return self._executor_for(self.tool_selector.select(question))
+    
+    def _executor_for(self, tools: Sequence[BaseTool]) -> BudgetedAgentExecutor:
+        """Get (building on first use) the ReAct agent executor for a tool subset."""
+        key = frozenset(tool.name for tool in tools)
+        executor = self._executors.get(key)
+        if executor is None:
+            # Steps may only name the tools this prompt offers
+            parser = self._parsers.setdefault(key, self.output_parser.for_tools(key))
+            
+            # Create ReAct agent
+            agent = create_react_agent(
+                llm=self.llm,
+                tools=list(tools),
+                prompt=self.prompt,
+                output_parser=parser
+            )
+            
+            # Create agent executor with memory, better error handling and deadline awareness
+            executor = BudgetedAgentExecutor(
+                agent=agent,
+                tools=list(tools),
+                memory=self.memory,
+                verbose=self.verbose,
+                handle_parsing_errors="Check your output and make sure it conforms to the expected format. Only provide ONE action per response, never both Action and Final Answer together.",
+                max_iterations=self.MAX_ITERATIONS,
+                return_intermediate_steps=False
+            )
+            executor = self._executors.setdefault(key, executor)
+        return executor
+    
+    @contextmanager
+    def _offering(self, executor: BudgetedAgentExecutor) -> Iterator[None]:
+        """Judge and dispatch streamed steps in the enclosed block against the executor's tools."""
+        token = _offered_parser.set(self._parsers[frozenset(tool.name for tool in executor.tools)])
+        try:
+            yield
+        finally:
+            _offered_parser.reset(token)
+    
+    def _current_parser(self) -> RobustReActOutputParser:
+        """Get the parser for the tools offered to the running question (all tools outside a question)."""
+        return _offered_parser.get() or self.output_parser
+    
+    def _dispatch_early(self, action: AgentAction) -> None:
+        """
+        Start a complete action's tool while the executor is still catching up.
+        
+        Only shared tools offered to the running question are started: the
+        executor's own call for the same input joins the request in flight or
+        reads the cached result. Tools with side effects (Python_REPL) or
+        trivial cost (calculator, get_datetime) simply run when the executor
+        gets to them.
+        """
+        self._count_dispatch("early_actions")
+        if action.tool not in self._current_parser().tool_names:
+            return
+        tool = self._tools_by_name.get(action.tool)
+        # Cassette sessions bypass the shared tool cache, so nothing would join a prefetch
+        if tool is None or action.tool not in PREFETCH_TOOLS or self.cassette is not None:
+            return
+        if tool.prefetch(str(action.tool_input)) is not None:
+            self._count_dispatch("prefetched")
+    
+    def _count_dispatch(self, key: str) -> None:
+        with self._dispatch_lock:
+            self._dispatch_stats[key] += 1
+    
+    def _get_dispatch_stats(self) -> Dict[str, int]:
+        with self._dispatch_lock:
+            return dict(self._dispatch_stats)
+    
+    def _trim_history(self, remaining_tokens: int) -> None:
+        """
+        Drop the oldest exchanges until resending the history fits the token budget.
+        
+        The history is part of every ReAct prompt, so it is paid for once per
+        iteration; it may take at most HISTORY_BUDGET_SHARE of what is left.
+        """
+        if isinstance(self.memory, LongTermMemory):
+            # Recall already keeps the prompt history to a fixed number of exchanges
+            return
+        messages = list(self.memory.chat_memory.messages)
+        allowance = remaining_tokens * HISTORY_BUDGET_SHARE
+        cost = self.MAX_ITERATIONS * sum(estimate_tokens(str(m.content)) for m in messages)
+        dropped = 0
+        while dropped < len(messages) and cost > allowance:
+            # Drop a question together with its answer
+            for message in messages[dropped:dropped + 2]:
+                cost -= self.MAX_ITERATIONS * estimate_tokens(str(message.content))
+            dropped += 2
+        if dropped:
+            self.memory.chat_memory.messages = messages[dropped:]
+            self.trimmed_messages += min(dropped, len(messages))
+
+
+def _requires_input(tool: BaseTool) -> bool:
+    """Check whether a tool has an argument without a default (single-string tools always do)."""
+    if tool.args_schema is None:
+        return True
+    return any(field.is_required() for field in tool.args_schema.model_fields.values())
@@ -0,0 +1,184 @@
+"""Conversation memory that recalls relevant past exchanges instead of resending all of them."""
+
+import threading
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from langchain.memory import ConversationBufferMemory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, get_buffer_string
+from pydantic import PrivateAttr
+
+from utils.text_vectors import HashedTextVectorizer
+
+
+# Rows allocated when a session's index is created; capacity doubles when full
+INITIAL_CAPACITY = 64
+
+# Vector length for exchanges: 512 bytes each, so a 5000-turn session scans 2.5 MB per recall
+MEMORY_VECTOR_DIM = 256
+
+# Rows converted to float32 at a time while scoring (float16 matmul has no BLAS path)
+SCORE_CHUNK_ROWS = 1024
+
+
+class ExchangeIndex:
+    """
+    Append-only vector index of one session's exchanges.
+
+    Vectors are stored as float16 rows of a preallocated matrix that doubles
+    when full, so adding an exchange is amortized O(1) and a lookup is one
+    matrix-vector product over contiguous memory.
+    """
+
+    def __init__(self, dim: int, capacity: int = INITIAL_CAPACITY):
+        """Create an empty index for vectors of length dim."""
+        self.dim = dim
+        self._vectors = np.zeros((capacity, dim), dtype=np.float16)
+        self._exchanges: List[Tuple[str, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._exchanges)
+
+    def add(self, vector: np.ndarray, question: str, answer: str) -> None:
+        """Append an exchange and its vector."""
+        count = len(self._exchanges)
+        if count == len(self._vectors):
+            grown = np.zeros((2 * len(self._vectors), self.dim), dtype=np.float16)
+            grown[:count] = self._vectors
+            self._vectors = grown
+        self._vectors[count] = vector
+        self._exchanges.append((question, answer))
+
+    def search(self, vector: np.ndarray, top_k: int, limit: int, min_score: float) -> List[int]:
+        """
+        Find the exchanges most similar to a vector.
+
+        Args:
+            vector: Query vector
+            top_k: Maximum number of exchanges to return
+            limit: Only consider the first limit exchanges
+            min_score: Minimum cosine similarity
+
+        Returns:
+            Positions of the matching exchanges, in conversation order
+        """
+        limit = min(limit, len(self._exchanges))
+        if limit <= 0 or top_k <= 0:
+            return []
+        vector = vector.astype(np.float32)
+        scores = np.empty(limit, dtype=np.float32)
+        for start in range(0, limit, SCORE_CHUNK_ROWS):
+            end = min(start + SCORE_CHUNK_ROWS, limit)
+            scores[start:end] = self._vectors[start:end].astype(np.float32) @ vector
+        if limit > top_k:
+            candidates = np.argpartition(-scores, top_k)[:top_k]
+        else:
+            candidates = np.arange(limit)
+        return sorted(int(i) for i in candidates if scores[i] >= min_score)
+
+    def exchange(self, position: int) -> Tuple[str, str]:
+        """Get the (question, answer) at a position."""
+        return self._exchanges[position]
+
+
+class LongTermMemory(ConversationBufferMemory):
+    """
+    ConversationBufferMemory whose prompt history stays the same size however long the conversation runs.
+
+    Every exchange is indexed as it is saved, in a per-session ExchangeIndex
+    of hashed lexical vectors (the vectorizer used for tool selection, with
+    fewer dimensions). The history handed to the
+    prompt is the last ``recent_k`` exchanges verbatim plus up to ``recall_k``
+    earlier exchanges most similar to the new question, in conversation
+    order. The full conversation is still kept in ``chat_memory`` for display.
+    """
+
+    session_id: str = "default"
+    recent_k: int = 2
+    recall_k: int = 3
+    min_score: float = 0.15
+
+    _indexes: Dict[str, ExchangeIndex] = PrivateAttr(default_factory=dict)
+    _vectorizer: HashedTextVectorizer = PrivateAttr(
+        default_factory=lambda: HashedTextVectorizer(dim=MEMORY_VECTOR_DIM)
+    )
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _stats: Dict[str, int] = PrivateAttr(
+        default_factory=lambda: {"indexed": 0, "lookups": 0, "recalled": 0}
+    )
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        """Save an exchange to the buffer and index it for recall."""
+        super().save_context(inputs, outputs)
+        question, answer = self._get_input_output(inputs, outputs)
+        vector = self._vectorizer.transform(f"{question}\n{answer}")
+        with self._lock:
+            index = self._indexes.get(self.session_id)
+            if index is None:
+                index = self._indexes[self.session_id] = ExchangeIndex(self._vectorizer.dim)
+            index.add(vector, question, answer)
+            self._stats["indexed"] += 1
+
+    async def asave_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        """Save an exchange (async variant)."""
+        self.save_context(inputs, outputs)
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the recent exchanges plus the past exchanges relevant to the new question."""
+        messages = self.recall(str(inputs.get(self.input_key or "input", "")))
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {
+            self.memory_key: get_buffer_string(
+                messages, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix
+            )
+        }
+
+    async def aload_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the history for a new question (async variant)."""
+        return self.load_memory_variables(inputs)
+
+    def recall(self, question: str) -> List[BaseMessage]:
+        """
+        Build the history for a new question.
+
+        Args:
+            question: The new question
+
+        Returns:
+            Recalled exchanges followed by the recent ones, as alternating messages
+        """
+        with self._lock:
+            index = self._indexes.get(self.session_id)
+            if index is None:
+                return []
+            older = len(index) - self.recent_k
+            positions = []
+            if older > 0 and question:
+                positions = index.search(
+                    self._vectorizer.transform(question), self.recall_k, older, self.min_score
+                )
+            positions += list(range(max(older, 0), len(index)))
+            exchanges = [index.exchange(position) for position in positions]
+            self._stats["lookups"] += 1
+            self._stats["recalled"] += len(positions) - min(self.recent_k, len(index))
+
+        messages: List[BaseMessage] = []
+        for question_text, answer in exchanges:
+            messages.append(HumanMessage(content=question_text))
+            messages.append(AIMessage(content=answer))
+        return messages
+
+    def clear(self) -> None:
+        """Clear the buffer and forget the current session's index."""
+        super().clear()
+        with self._lock:
+            self._indexes.pop(self.session_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get indexing and recall counters and the current session's size."""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            index = self._indexes.get(self.session_id)
+            stats["session_exchanges"] = len(index) if index is not None else 0
+        return stats
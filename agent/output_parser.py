@@ -0,0 +1,381 @@
+"""Robust ReAct output parser that salvages malformed LLM responses."""
+
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+from langchain.agents.agent import AgentOutputParser
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.exceptions import OutputParserException
+from pydantic import Field, PrivateAttr
+
+
+FINAL_ANSWER_RE = re.compile(r"Final\s*Answer\s*:", re.IGNORECASE)
+ACTION_RE = re.compile(r"^\s*\**\s*Action\s*\d*\s*\**\s*:\**[ \t]*(.*)$", re.IGNORECASE | re.MULTILINE)
+ACTION_INPUT_RE = re.compile(r"^\s*\**\s*Action\s*\d*\s*Input\s*\d*\s*\**\s*:\**[ \t]*(.*)$", re.IGNORECASE | re.MULTILINE)
+OBSERVATION_RE = re.compile(r"^\s*\**\s*Observation\s*\d*\s*\**\s*:", re.IGNORECASE | re.MULTILINE)
+THOUGHT_RE = re.compile(r"^\s*\**\s*Thought\s*\d*\s*\**\s*:", re.IGNORECASE | re.MULTILINE)
+FENCE_RE = re.compile(r"^\s*```[\w-]*\s*$", re.MULTILINE)
+
+# Inline call forms such as `wikipedia("Alan Turing")` or `web_search[bitcoin price]`
+INLINE_CALL_RE = re.compile(r"^([\w\-.]+)\s*[\(\[](.*)[\)\]]\s*$", re.DOTALL)
+
+# The prompt's "Do I need to use a tool? Yes/No" lead-in; group 1 is the model's verdict
+TOOL_LEAD_IN_RE = re.compile(r"^\s*Do\s+I\s+need\s+to\s+use\s+a\s+tool\s*\?\s*(\w*)[\s.,:;!-]*", re.IGNORECASE)
+
+# CustomGeminiLLM.text_to_text returns failed calls as text starting with this
+LLM_ERROR_PREFIX = "Error in text_to_text:"
+
+# Tools whose Action Input may continue past its first line (e.g. code)
+MULTILINE_INPUT_TOOLS = ("Python_REPL",)
+
+# Recovery rules that guess at what the model meant rather than fix its formatting
+GUESSED_RECOVERIES = ("bare_answer", "incomplete_action")
+
+
+class RobustReActOutputParser(AgentOutputParser):
+    """
+    ReAct output parser that recovers the intended step deterministically.
+
+    The stock ReAct parser rejects any response that deviates from the
+    format, which costs an extra LLM round trip via ``handle_parsing_errors``.
+    This parser instead applies a fixed set of recovery rules:
+
+    - Markdown fences and bold keywords are stripped before parsing
+    - Action and Final Answer together: the Final Answer wins when the model
+      hallucinated an Observation before it, otherwise the first complete
+      action is taken (streamed steps are cut at the action first, see
+      ``IncrementalReActParser``)
+    - Several actions: only the first complete action is taken
+    - Missing "Action Input": recovered from inline call syntax on the Action
+      line or from the next free-text line; an empty input is only taken for
+      tools that need none (``no_input_tools``)
+    - Tool names are matched case-insensitively against the known tools
+    - Plain text with no ReAct keywords at all is treated as the Final Answer,
+      after dropping a "Do I need to use a tool? No" lead-in
+
+    Reasoning without a step (a Thought line, or the "Do I need to use a
+    tool? Yes" lead-in with no Action) and failed LLM calls are never taken
+    as answers. Output that cannot be salvaged raises
+    ``OutputParserException``, so ``handle_parsing_errors`` asks again.
+    """
+
+    tool_names: List[str] = Field(default_factory=list)
+    # Tools that may be called without an input (every argument has a default)
+    no_input_tools: List[str] = Field(default_factory=list)
+    # Have escalation_reason send even clean routing-stage Final Answers to the stronger model
+    escalate_answers: bool = False
+
+    _stats: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def parse(self, text: str) -> Union[AgentAction, AgentFinish]:
+        """
+        Parse an LLM response into an agent action or final answer.
+
+        Args:
+            text: Raw LLM output
+
+        Returns:
+            AgentAction for a tool call or AgentFinish for a final answer
+        """
+        try:
+            result, recovery = self._parse(text)
+        except OutputParserException:
+            self._record("failed")
+            raise
+
+        self._record("parsed")
+        self._record(f"recovered:{recovery}" if recovery else "clean")
+        return result
+
+    def can_parse(self, text: str) -> bool:
+        """Check whether text can be parsed, without touching the counters."""
+        try:
+            self._parse(text)
+            return True
+        except OutputParserException:
+            return False
+
+    def escalation_reason(self, text: str) -> Optional[str]:
+        """
+        Judge a fast model's first ReAct step for the model cascade.
+
+        Calls to known tools and cleanly formatted Final Answers are accepted,
+        so a question that needs no tool still costs a single generation.
+        Output that only parses by guessing (GUESSED_RECOVERIES) or not at
+        all is escalated, and so is a call to a tool outside ``tool_names``
+        and a Final Answer that came with an action (e.g. after a
+        hallucinated Observation). With ``escalate_answers`` every Final
+        Answer is escalated.
+
+        Args:
+            text: Raw LLM output
+
+        Returns:
+            None to accept the step, otherwise 'parse_error', 'low_confidence'
+            or 'final_answer'
+        """
+        try:
+            step, recovery = self._parse(text)
+        except OutputParserException:
+            return "parse_error"
+        if recovery in GUESSED_RECOVERIES:
+            return "parse_error"
+        if isinstance(step, AgentAction) and step.tool not in self.tool_names:
+            return "parse_error"
+        if isinstance(step, AgentFinish):
+            if recovery not in (None, "fences"):
+                return "low_confidence"
+            if self.escalate_answers:
+                return "final_answer"
+        return None
+
+    def for_tools(self, tool_names: Sequence[str]) -> "RobustReActOutputParser":
+        """
+        Get a parser that only knows some of this parser's tools.
+
+        Args:
+            tool_names: Names of the tools offered in the prompt
+
+        Returns:
+            A copy whose tool names are limited to tool_names, sharing this
+            parser's counters; actions naming any other tool are left unresolved
+        """
+        parser = self.model_copy(update={
+            "tool_names": [name for name in self.tool_names if name in tool_names],
+            "no_input_tools": [name for name in self.no_input_tools if name in tool_names],
+        })
+        parser._stats = self._stats
+        parser._lock = self._lock
+        return parser
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get parse and recovery counters (clean, recovered:<rule>, failed)."""
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self) -> None:
+        """Reset parse and recovery counters."""
+        with self._lock:
+            self._stats.clear()
+
+    @property
+    def _type(self) -> str:
+        return "robust-react-single-input"
+
+    def _record(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] = self._stats.get(key, 0) + 1
+
+    def _parse(self, text: str) -> Tuple[Union[AgentAction, AgentFinish], Optional[str]]:
+        """Return the parsed step and the name of the recovery rule used, if any."""
+        if text.lstrip().startswith(LLM_ERROR_PREFIX):
+            raise self._invalid(text, "The model call failed; answer again in the expected format")
+        cleaned = FENCE_RE.sub("", text).strip()
+        recovery = "fences" if cleaned != text.strip() else None
+
+        answer_match = FINAL_ANSWER_RE.search(cleaned)
+        action_match = ACTION_RE.search(cleaned)
+
+        if action_match and answer_match:
+            observation = OBSERVATION_RE.search(cleaned, action_match.end())
+            if answer_match.start() < action_match.start():
+                return self._finish(cleaned, answer_match, text), "answer_before_action"
+            if observation and observation.start() < answer_match.start():
+                return self._finish(cleaned, answer_match, text), "hallucinated_observation"
+            action = self._action(cleaned, action_match, text)
+            if action is not None:
+                return action[0], "action_and_answer"
+            return self._finish(cleaned, answer_match, text), "incomplete_action"
+
+        if answer_match:
+            return self._finish(cleaned, answer_match, text), recovery
+
+        if action_match:
+            action = self._action(cleaned, action_match, text)
+            if action is None:
+                raise self._invalid(text, "Invalid Format: Missing 'Action Input:' after 'Action:'")
+            step, action_recovery = action
+            if len(ACTION_RE.findall(cleaned)) > 1:
+                action_recovery = action_recovery or "multiple_actions"
+            return step, action_recovery or recovery
+
+        # No ReAct keywords: the model answered directly, unless it is still reasoning
+        if THOUGHT_RE.search(cleaned):
+            raise self._invalid(text, "Invalid Format: Missing 'Action:' after 'Thought:'")
+        answer = cleaned
+        lead_in = TOOL_LEAD_IN_RE.match(cleaned)
+        if lead_in:
+            if lead_in.group(1).lower() != "no":
+                raise self._invalid(text, "Invalid Format: Missing 'Action:' after 'Thought:'")
+            answer = cleaned[lead_in.end():].strip()
+        if not answer:
+            raise self._invalid(text, "Invalid Format: Missing 'Final Answer:' after 'Thought:'")
+        return AgentFinish({"output": answer}, text), "bare_answer"
+
+    @staticmethod
+    def _invalid(text: str, observation: str) -> OutputParserException:
+        """Build the exception for output that cannot be parsed or salvaged."""
+        return OutputParserException(
+            f"Could not parse LLM output: `{text}`",
+            observation=observation,
+            llm_output=text,
+            send_to_llm=True,
+        )
+
+    def _finish(self, cleaned: str, answer_match: re.Match, text: str) -> AgentFinish:
+        """Build a final answer from the text following 'Final Answer:'."""
+        answer = cleaned[answer_match.end():]
+        # Drop anything the model invented after its answer
+        stop = re.search(r"^\s*(Thought|Action|Observation)\s*\d*\s*:", answer, re.IGNORECASE | re.MULTILINE)
+        if stop:
+            answer = answer[:stop.start()]
+        return AgentFinish({"output": answer.strip()}, text)
+
+    def _action(
+        self, cleaned: str, action_match: re.Match, text: str
+    ) -> Optional[Tuple[AgentAction, Optional[str]]]:
+        """Build the first complete action, or None if no input can be recovered."""
+        recovery = None
+        raw_tool = action_match.group(1).strip().strip("`*'\" ")
+
+        # Limit the search for the input to this action's block
+        block_end = len(cleaned)
+        for pattern in (OBSERVATION_RE, THOUGHT_RE, FINAL_ANSWER_RE):
+            boundary = pattern.search(cleaned, action_match.end())
+            if boundary:
+                block_end = min(block_end, boundary.start())
+        next_action = ACTION_RE.search(cleaned, action_match.end())
+        input_match = ACTION_INPUT_RE.search(cleaned, action_match.end(), block_end)
+        if next_action and (not input_match or next_action.start() < input_match.start()):
+            block_end = min(block_end, next_action.start())
+            input_match = None
+
+        if input_match:
+            following_action = ACTION_RE.search(cleaned, input_match.end(), block_end)
+            if following_action:
+                block_end = following_action.start()
+            # Multi-line inputs (e.g. code) run until the end of the block
+            tool_input = cleaned[input_match.start(1):block_end].strip()
+        else:
+            inline = INLINE_CALL_RE.match(raw_tool)
+            if inline:
+                raw_tool, tool_input = inline.group(1), inline.group(2).strip()
+                recovery = "inline_action_input"
+            else:
+                tool_input = cleaned[action_match.end():block_end].strip()
+                recovery = "missing_action_input"
+
+        tool = self._resolve_tool(raw_tool)
+        if tool is None:
+            tool = raw_tool
+        elif tool != raw_tool:
+            recovery = recovery or "tool_name"
+
+        tool_input = tool_input.strip(" ").strip('"')
+        if not tool_input and tool not in self.no_input_tools:
+            return None
+        return AgentAction(tool, tool_input, text), recovery
+
+    def _resolve_tool(self, raw_tool: str) -> Optional[str]:
+        """Match a tool name case-insensitively against the known tools."""
+        if raw_tool in self.tool_names:
+            return raw_tool
+        normalized = raw_tool.lower().replace(" ", "_")
+        for name in self.tool_names:
+            if name.lower() == normalized:
+                return name
+        return None
+
+
+class IncrementalReActParser:
+    """
+    Watches a streamed ReAct response and spots a complete action early.
+
+    An action is complete once its "Action Input:" line has been terminated
+    by a newline: the model would otherwise only go on to hallucinate an
+    Observation, which the executor discards. The step is parsed with the
+    same rules as ``RobustReActOutputParser`` so the dispatched action equals
+    the one the executor will run. Tools whose input may span several lines
+    (code) are never cut short.
+
+    The cut takes precedence over the parser's rule that a Final Answer
+    written after a hallucinated Observation wins: a streamed step ends at
+    its action, so that rule only applies where the stream is not cut
+    (multi-line tools and non-streamed calls). Running the tool is the
+    intended outcome, since the next step then answers from the real
+    Observation rather than the invented one.
+
+    Create one per LLM call; ``feed`` is meant to be used as the ``on_chunk``
+    callback of ``CustomGeminiLLM.text_to_text``. When the cascade escalates,
+    the next model streams from scratch and the parser starts over.
+    """
+
+    def __init__(
+        self,
+        parser: RobustReActOutputParser,
+        on_action: Optional[Callable[[AgentAction], None]] = None,
+        multiline_tools: Sequence[str] = MULTILINE_INPUT_TOOLS
+    ):
+        """
+        Args:
+            parser: Parser whose rules and tool names decide what the step is
+            on_action: Called once with the action as soon as it is complete
+            multiline_tools: Tools whose input is never treated as a single line
+        """
+        self.parser = parser
+        self.on_action = on_action
+        self.multiline_tools = set(multiline_tools)
+        self.action: Optional[AgentAction] = None
+        self._last_text = ""
+        self._scanned = 0
+        self._done = False
+
+    def feed(self, text: str) -> Optional[int]:
+        """
+        Inspect the response so far.
+
+        Args:
+            text: Everything streamed so far
+
+        Returns:
+            Length of the complete action step to keep, or None to keep streaming
+        """
+        if not text.startswith(self._last_text):
+            # Text that does not extend the last chunk is the next model's attempt
+            self._scanned = 0
+            self._done = False
+        self._last_text = text
+        if self._done:
+            return None
+        # Only a newline can complete the Action Input line
+        if "\n" not in text[self._scanned:]:
+            return None
+        self._scanned = len(text)
+
+        if FINAL_ANSWER_RE.search(text):
+            self._done = True
+            return None
+        input_match = ACTION_INPUT_RE.search(text)
+        if input_match is None or input_match.end() >= len(text):
+            return None
+
+        # Nothing is dispatched unless the input sits on the Action Input line itself
+        self._done = True
+        tool_input = input_match.group(1).strip()
+        if not tool_input or tool_input.startswith("```"):
+            return None
+        cut = input_match.end()
+        try:
+            step, _ = self.parser._parse(text[:cut])
+        except OutputParserException:
+            return None
+        if not isinstance(step, AgentAction) or step.tool in self.multiline_tools:
+            return None
+        if step.tool not in self.parser.tool_names:
+            return None
+
+        self.action = step
+        if self.on_action is not None:
+            self.on_action(step)
+        return cut
@@ -0,0 +1,112 @@
+"""Per-question tool subset selection to keep the ReAct prompt small."""
+
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.tools import BaseTool
+
+from prompts.function_definitions import ALL_FUNCTIONS, FUNCTION_DESCRIPTIONS, FUNCTION_KEYWORDS
+from utils.text_vectors import HashedTextVectorizer, text_vectorizer
+
+
+# Function definition names that differ from the tool's LangChain name
+FUNCTION_TOOL_NAMES = {
+    "python_repl_ast": "Python_REPL",
+}
+
+# General-purpose tools offered for every question
+ALWAYS_INCLUDED_TOOLS = ("web_search",)
+
+DEFAULT_TOP_K = 2
+
+# Minimum cosine similarity for a tool to be offered (hash collisions and stray n-grams stay below ~0.07)
+MIN_TOOL_SCORE = 0.08
+
+
+class ToolSelector:
+    """
+    Picks the tools most relevant to a question.
+
+    Each tool is described by its function definition (description and
+    parameter descriptions), its entry in FUNCTION_DESCRIPTIONS and its
+    FUNCTION_KEYWORDS. These documents are vectorized once; selecting tools
+    for a question is then one hashed vectorization and a small matrix-vector
+    product. The top_k best matches are offered together with the
+    ALWAYS_INCLUDED_TOOLS, in the original tool order.
+    """
+
+    def __init__(
+        self,
+        tools: Sequence[BaseTool],
+        top_k: int = DEFAULT_TOP_K,
+        always_include: Sequence[str] = ALWAYS_INCLUDED_TOOLS,
+        vectorizer: Optional[HashedTextVectorizer] = None
+    ):
+        """
+        Args:
+            tools: All tools the agent can use
+            top_k: Number of best-matching tools to offer besides the always-included ones
+            always_include: Tool names offered for every question
+            vectorizer: Text vectorizer (defaults to the shared text_vectorizer)
+        """
+        self.tools = list(tools)
+        self.top_k = top_k
+        self.always_include = [name for name in always_include if any(t.name == name for t in self.tools)]
+        self.vectorizer = vectorizer or text_vectorizer
+        self._matrix = self.vectorizer.transform_many(
+            self._tool_document(tool) for tool in self.tools
+        )
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"selections": 0, "tools_offered": 0}
+        self._selected: Dict[str, int] = {}
+
+    def select(self, question: str) -> List[BaseTool]:
+        """
+        Choose the tools to offer for a question.
+
+        Args:
+            question: User question
+
+        Returns:
+            Selected tools in the original tool order
+        """
+        scores = self._matrix @ self.vectorizer.transform(question)
+        chosen = set(self.always_include)
+        for index in np.argsort(-scores, kind="stable")[:self.top_k]:
+            # Tools with no lexical overlap at all are not worth their prompt tokens
+            if scores[index] >= MIN_TOOL_SCORE:
+                chosen.add(self.tools[index].name)
+        selected = [tool for tool in self.tools if tool.name in chosen]
+
+        with self._lock:
+            self._stats["selections"] += 1
+            self._stats["tools_offered"] += len(selected)
+            for tool in selected:
+                self._selected[tool.name] = self._selected.get(tool.name, 0) + 1
+        return selected
+
+    def get_stats(self) -> Dict[str, object]:
+        """Get selection counters and the average number of tools offered."""
+        with self._lock:
+            stats: Dict[str, object] = dict(self._stats)
+            stats["avg_tools_offered"] = round(
+                self._stats["tools_offered"] / self._stats["selections"], 2
+            ) if self._stats["selections"] else 0.0
+            stats["selected"] = dict(self._selected)
+        return stats
+
+    @staticmethod
+    def _tool_document(tool: BaseTool) -> str:
+        """Text describing what a tool is for."""
+        names = [tool.name] + [f for f, t in FUNCTION_TOOL_NAMES.items() if t == tool.name]
+        parts = [tool.name.replace("_", " "), tool.description]
+        for function in ALL_FUNCTIONS:
+            if function["name"] in names:
+                parts.append(function.get("description", ""))
+                for prop in function.get("parameters", {}).get("properties", {}).values():
+                    parts.append(prop.get("description", ""))
+        for name in names:
+            parts.append(FUNCTION_DESCRIPTIONS.get(name, ""))
+            parts.append(FUNCTION_KEYWORDS.get(name, ""))
+        return " ".join(part for part in parts if part)
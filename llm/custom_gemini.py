@@ -1,54 +1,483 @@
 """Custom Gemini LLM with exactly 3 methods and rate limiting."""
 
-import time
 import json
+import copy
+import math
 import google.generativeai as genai
-from typing import List, Dict, Any
+from typing import Callable, List, Dict, Any, Optional, Tuple
 from prompts.schemas import FUNCTION_CALL_SCHEMA
+from utils.cassette import Cassette
+from utils.deadline import Deadline, DeadlineExceeded, get_current_deadline, track
+from utils.shared_store import RateLimiter, ResponseCache, SharedStore
+from utils.single_flight import SingleFlight
+from .model_cascade import DEFAULT_MODEL, ModelCascade
+from .scheduler import LLMScheduler, llm_scheduler, resolve_class
+from .token_usage import TokenLedger, get_usage_context, token_ledger
+
+
+# Shared by all instances so identical requests from different sessions coalesce
+llm_flight = SingleFlight()
+
+# Candidates below this average token log-probability count as low confidence
+LOW_CONFIDENCE_LOGPROB = -1.0
+
+# Finish reason of a streamed response that on_chunk ended early, once the text it needs was complete
+STREAM_CUT_FINISH_REASON = "STREAM_CUT"
+
+# Finish reasons that mean the model completed its answer normally
+NORMAL_FINISH_REASONS = {"STOP", "FINISH_REASON_UNSPECIFIED", STREAM_CUT_FINISH_REASON}
+
+# Only answers the model ended itself, or that on_chunk cut once complete, are cached
+# (not ones cut off by max_output_tokens); cut answers are keyed apart from whole ones
+CACHEABLE_FINISH_REASONS = {"STOP", STREAM_CUT_FINISH_REASON}
+
+# Minimum seconds between Gemini calls, shared by every worker using the same store
+RATE_LIMIT_INTERVAL_S = 1.0
+
+# Pause for all workers after a quota (429) error, so they do not retry in a herd
+QUOTA_BACKOFF_S = 5.0
+
+# Seconds identical requests are answered from the shared response cache
+LLM_CACHE_TTL_S = 600
+
+# Output-length cap under a deadline: tokens the model is expected to emit per second left
+OUTPUT_TOKENS_PER_SECOND = 150
+MIN_OUTPUT_TOKENS = 64
+MAX_OUTPUT_TOKENS = 2048
+
+# Below this many seconds left, the current tier's answer is kept instead of escalating
+MIN_ESCALATION_BUDGET_S = 2.0
+
+JSON_TYPES = {
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "array": (list,),
+    "object": (dict,),
+    "null": (type(None),),
+}
+
+
+class _RecordedCandidate:
+    """Candidate fields needed to judge a recorded response."""
+    
+    def __init__(self, finish_reason: str, avg_logprobs: Optional[float]):
+        self.finish_reason = finish_reason
+        self.avg_logprobs = avg_logprobs
+
+
+class _RecordedUsage:
+    """Usage metadata fields needed for token accounting."""
+    
+    def __init__(self, usage: Dict[str, int]):
+        self.prompt_token_count = usage.get("prompt_token_count", 0)
+        self.candidates_token_count = usage.get("candidates_token_count", 0)
+
+
+class _RecordedResponse:
+    """generate_content response rebuilt from a snapshot (cassette or collected stream)."""
+    
+    def __init__(self, snapshot: Dict[str, Any]):
+        self.text = snapshot["text"]
+        self.candidates = [
+            _RecordedCandidate(snapshot["finish_reason"], snapshot.get("avg_logprobs"))
+        ]
+        # Cassettes recorded before token accounting carry no usage
+        usage = snapshot.get("usage")
+        self.usage_metadata = _RecordedUsage(usage) if usage else None
 
 
 class CustomGeminiLLM:
     """Custom Gemini LLM wrapper with exactly 3 methods."""
     
-    def __init__(self, api_key: str):
-        """Initialize the Gemini LLM with API key."""
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str = DEFAULT_MODEL,
+        cascade: Optional[ModelCascade] = None,
+        cassette: Optional[Cassette] = None,
+        store: Optional[SharedStore] = None,
+        ledger: Optional[TokenLedger] = None,
+        scheduler: Optional[LLMScheduler] = None
+    ):
+        """
+        Initialize the Gemini LLM with API key.
+        
+        Args:
+            api_key: Gemini API key
+            model_name: Model used for stages without a cascade configuration
+            cascade: Per-stage model tiers; defaults to the tiers in model_cascade.py
+            cassette: Records generate_content traffic, or replays it without calling Gemini
+            store: Shared store for the rate limiter and response cache (defaults to get_shared_store())
+            ledger: Token ledger recording usage_metadata of every call (defaults to token_ledger)
+            scheduler: Orders calls across sessions and priority classes (defaults to llm_scheduler)
+        """
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.model = genai.GenerativeModel(model_name)
+        self.cascade = cascade or ModelCascade(default_model=model_name)
+        self._models = {model_name: self.model}
+        self.cassette = cassette
+        # Identical concurrent requests share one generate_content call
+        self.flight = llm_flight
+        # Pacing and cached responses are shared across worker processes via the store
+        self.rate_limiter = RateLimiter("gemini", RATE_LIMIT_INTERVAL_S, store=store)
+        if cassette is not None and cassette.replaying:
+            # Replay keeps the real queueing and pacing, on its own quota and scaled like the recorded latencies
+            self.rate_limiter = RateLimiter(
+                "gemini_replay", RATE_LIMIT_INTERVAL_S * cassette.latency_scale, store=store
+            )
+        self.cache = ResponseCache("llm_response", LLM_CACHE_TTL_S, store=store)
+        self.ledger = ledger or token_ledger
+        # Decides which session's call gets the next rate-limit slot
+        self.scheduler = scheduler or llm_scheduler
     
-    def text_to_text(self, prompt: str) -> str:
+    def text_to_text(
+        self,
+        prompt: str,
+        stage: Optional[str] = None,
+        validator: Optional[Callable[[str], Optional[str]]] = None,
+        on_chunk: Optional[Callable[[str], Optional[int]]] = None
+    ) -> str:
         """
         Basic text completion method.
         
         Args:
             prompt: Input text prompt
+            stage: Pipeline stage used for model selection (e.g. 'routing')
+            validator: Optional check returning None to accept the output, or an
+                escalation reason (e.g. 'parse_error') to retry on the next model
+            on_chunk: Streams the response; called with the text so far after each
+                chunk, it returns a length to cut the text at and end the stream,
+                or None to keep reading
             
         Returns:
-            Generated text response
+            Generated text response; other failures come back as "Error in text_to_text: ..."
+            
+        Raises:
+            DeadlineExceeded: The request deadline ran out before a response, so the
+                caller can answer best-effort instead of treating an error as output
         """
+        stage = self.cascade.resolve_stage("text_to_text", stage)
         try:
-            # Rate limiting - 1 second between calls
-            time.sleep(1)
-            
-            response = self.model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            return f"Error in text_to_text: {str(e)}"
+            return self._shared(
+                ("text_to_text", stage, prompt, on_chunk is not None),
+                lambda: self._text_to_text(prompt, stage, validator, on_chunk)
+            )
+        except TimeoutError as e:
+            # Waiting on an identical in-flight request is bounded by the request deadline
+            raise DeadlineExceeded(str(e)) from e
     
-    def text_to_json(self, prompt: str, schema: dict) -> dict:
+    def text_to_json(self, prompt: str, schema: dict, stage: Optional[str] = None) -> dict:
         """
         Generate structured JSON response.
         
         Args:
             prompt: Input text prompt
             schema: JSON schema for validation
+            stage: Pipeline stage used for model selection
             
         Returns:
             Structured JSON response
         """
+        stage = self.cascade.resolve_stage("text_to_json", stage)
         try:
-            # Rate limiting - 1 second between calls
-            time.sleep(1)
+            result = self._shared(
+                ("text_to_json", stage, prompt, json.dumps(schema, sort_keys=True)),
+                lambda: self._text_to_json(prompt, schema, stage)
+            )
+        except TimeoutError as e:
+            return {"error": f"Error in text_to_json: {str(e)}"}
+        # Coalesced callers share the result, so hand each one its own copy
+        return copy.deepcopy(result)
+    
+    def text_to_function_call(
+        self,
+        prompt: str,
+        functions: List[dict],
+        stage: Optional[str] = None
+    ) -> dict:
+        """
+        Generate function call in Vertex AI style.
+        
+        Args:
+            prompt: Input text prompt
+            functions: List of available function definitions
+            stage: Pipeline stage used for model selection
             
+        Returns:
+            Function call specification
+        """
+        stage = self.cascade.resolve_stage("text_to_function_call", stage)
+        try:
+            result = self._shared(
+                ("text_to_function_call", stage, prompt, json.dumps(functions, sort_keys=True)),
+                lambda: self._text_to_function_call(prompt, functions, stage)
+            )
+        except TimeoutError as e:
+            return {
+                "function_name": None,
+                "parameters": None,
+                "error": f"Error in text_to_function_call: {str(e)}"
+            }
+        return copy.deepcopy(result)
+    
+    def get_flight_stats(self) -> Dict[str, int]:
+        """Get single-flight counters (calls, executions, coalesced)."""
+        return self.flight.get_stats()
+    
+    def get_cache_stats(self) -> Dict[str, int]:
+        """Get this process's response cache hit and miss counters."""
+        return self.cache.get_stats()
+    
+    def get_cascade_stats(self) -> Dict[str, Any]:
+        """Get per-tier latency and escalation-rate metrics."""
+        return self.cascade.get_stats()
+    
+    def get_scheduler_stats(self) -> Dict[str, Any]:
+        """Get per-priority-class admission counters and queue-wait histograms."""
+        return self.scheduler.get_stats()
+    
+    def get_token_usage(
+        self,
+        session_id: Optional[str] = None,
+        group_by: tuple = ("method",)
+    ) -> List[Dict[str, Any]]:
+        """Get token usage aggregated by any of session, method, model, stage and iteration."""
+        return self.ledger.query(session_id=session_id, group_by=group_by)
+    
+    def _get_model(self, model_name: str) -> Any:
+        """Get (and cache) the GenerativeModel for a model name."""
+        model = self._models.get(model_name)
+        if model is None:
+            model = self._models.setdefault(model_name, genai.GenerativeModel(model_name))
+        return model
+    
+    def _shared(self, key: tuple, fn: Callable[[], Tuple[Any, Optional[str]]]) -> Any:
+        """
+        Serve from the shared cache, or run fn once per key via single-flight within the deadline.
+        
+        fn returns (result, finish_reason); the pair is what gets cached. A
+        caller whose shared call failed on the leader's deadline retries under
+        its own. With a cassette both layers are bypassed: recording must
+        capture every prompt, and each replayed session must read the cassette
+        itself so N copies really put N times the load on the agent.
+        """
+        if self.cassette is not None:
+            return fn()[0]
+        deadline = get_current_deadline()
+        # The leader's deadline sets the request timeout and output cap, so only
+        # callers with about as much time left share a call
+        flight_key = key + (self._deadline_bucket(deadline),)
+        led = []
+        
+        def lead() -> Tuple[Any, Optional[str]]:
+            led.append(True)
+            return fn()
+        
+        def compute() -> List[Any]:
+            try:
+                return list(self.flight.do(
+                    flight_key, lead, timeout=deadline.timeout() if deadline else None
+                ))
+            except DeadlineExceeded:
+                if led or (deadline is not None and deadline.expired):
+                    raise
+                # The leader ran out of its own time; this caller still has some
+                return list(fn())
+        
+        entry = self.cache.get_or_compute(list(key), compute, cacheable=self._is_cacheable)
+        return entry[0]
+    
+    @staticmethod
+    def _deadline_bucket(deadline: Optional[Deadline]) -> Optional[int]:
+        """Seconds left on a deadline rounded down to a power of two (None when unbounded)."""
+        timeout = deadline.timeout() if deadline else None
+        if timeout is None:
+            return None
+        return 2 ** int(math.log2(timeout)) if timeout >= 1 else 0
+    
+    def _generate(
+        self,
+        method: str,
+        prompt: str,
+        stage: str,
+        accept: Callable[[Any], Optional[str]],
+        on_chunk: Optional[Callable[[str], Optional[int]]] = None
+    ) -> Any:
+        """Call generate_content through the stage's model cascade."""
+        deadline = get_current_deadline()
+        usage = get_usage_context()
+        priority_class = resolve_class(stage)
+        session = usage.session_id if usage is not None else "default"
+        
+        def call(model_name: str) -> Any:
+            if deadline is not None:
+                deadline.check()
+            try:
+                with track("llm"):
+                    response = self._call_model(
+                        model_name, prompt, self._request_options(deadline), on_chunk
+                    )
+            except Exception as e:
+                if self._is_quota_error(e):
+                    self.rate_limiter.back_off(QUOTA_BACKOFF_S)
+                raise
+            # Every tier attempt is billed, including ones the cascade escalates past
+            self._record_usage(method, model_name, stage, prompt, response)
+            return response
+        
+        def accept_within_deadline(response: Any) -> Optional[str]:
+            # Out of time: keep this tier's answer rather than escalate
+            if deadline is not None and deadline.remaining() < MIN_ESCALATION_BUDGET_S:
+                return None
+            return accept(response)
+        
+        def pace() -> None:
+            # Queue fairly for the next slot; rejected up front if the wait would break the deadline
+            with self.scheduler.slot(priority_class, session, deadline):
+                # Rate limiting - shared schedule across workers, never waiting past the deadline
+                with track("rate_limit"):
+                    if not self.rate_limiter.wait(deadline.timeout() if deadline else None):
+                        raise DeadlineExceeded("no rate-limit slot before the request deadline")
+        
+        return self.cascade.run(stage, call, accept_within_deadline, pace=pace)
+    
+    def _record_usage(self, method: str, model_name: str, stage: str, prompt: str, response: Any) -> None:
+        """Add a response's usage_metadata to the token ledger."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        self.ledger.record(
+            method,
+            model_name,
+            stage,
+            prompt,
+            getattr(usage, "prompt_token_count", 0) or 0,
+            getattr(usage, "candidates_token_count", 0) or 0
+        )
+    
+    @staticmethod
+    def _request_options(deadline: Optional[Deadline]) -> Dict[str, Any]:
+        """Get generate_content options that keep a call inside the request deadline."""
+        timeout = deadline.timeout() if deadline else None
+        if timeout is None:
+            return {}
+        max_tokens = int(timeout * OUTPUT_TOKENS_PER_SECOND)
+        return {
+            "request_options": {"timeout": max(timeout, 0.1)},
+            "generation_config": {
+                "max_output_tokens": max(MIN_OUTPUT_TOKENS, min(MAX_OUTPUT_TOKENS, max_tokens))
+            },
+        }
+    
+    def _call_model(
+        self,
+        model_name: str,
+        prompt: str,
+        options: Optional[Dict[str, Any]] = None,
+        on_chunk: Optional[Callable[[str], Optional[int]]] = None
+    ) -> Any:
+        """Call generate_content on one model, through the cassette if one is set."""
+        options = options or {}
+        model = self._get_model(model_name)
+        if on_chunk is not None:
+            generate = lambda: self._stream(model, prompt, options, on_chunk)
+        else:
+            generate = lambda: self._snapshot(model.generate_content(prompt, **options))
+        if self.cassette is None:
+            if on_chunk is None:
+                return model.generate_content(prompt, **options)
+            return _RecordedResponse(generate())
+        # Replayed streams are returned whole; the recording already holds any cut
+        return _RecordedResponse(self.cassette.call("llm", (model_name, prompt), generate))
+    
+    def _stream(
+        self,
+        model: Any,
+        prompt: str,
+        options: Dict[str, Any],
+        on_chunk: Callable[[str], Optional[int]]
+    ) -> Dict[str, Any]:
+        """Stream a response into a snapshot, stopping early when on_chunk cuts it."""
+        response = model.generate_content(prompt, stream=True, **options)
+        text = ""
+        last_chunk = None
+        for chunk in response:
+            last_chunk = chunk
+            try:
+                text += chunk.text
+            except ValueError:
+                continue
+            cut = on_chunk(text)
+            if cut is not None:
+                # The rest of the generation is not needed; the client has no public way to
+                # cancel a stream, so stop reading and let the transport release it once the
+                # response is dropped on return
+                snapshot = self._snapshot(last_chunk)
+                snapshot.update(text=text[:cut], finish_reason=STREAM_CUT_FINISH_REASON)
+                return snapshot
+        snapshot = self._snapshot(last_chunk) if last_chunk is not None else {
+            "text": "", "finish_reason": "FINISH_REASON_UNSPECIFIED", "avg_logprobs": None, "usage": None
+        }
+        snapshot["text"] = text
+        return snapshot
+    
+    @staticmethod
+    def _snapshot(response: Any) -> Dict[str, Any]:
+        """Reduce a generate_content response to the JSON fields the LLM uses."""
+        try:
+            text = response.text
+        except ValueError:
+            text = ""
+        candidate = response.candidates[0] if response.candidates else None
+        finish_reason = getattr(candidate, "finish_reason", "FINISH_REASON_UNSPECIFIED")
+        usage = getattr(response, "usage_metadata", None)
+        return {
+            "text": text,
+            "finish_reason": getattr(finish_reason, "name", str(finish_reason)),
+            "avg_logprobs": getattr(candidate, "avg_logprobs", None),
+            "usage": {
+                "prompt_token_count": getattr(usage, "prompt_token_count", 0) or 0,
+                "candidates_token_count": getattr(usage, "candidates_token_count", 0) or 0,
+            } if usage is not None else None,
+        }
+    
+    def _text_to_text(
+        self,
+        prompt: str,
+        stage: str,
+        validator: Optional[Callable[[str], Optional[str]]],
+        on_chunk: Optional[Callable[[str], Optional[int]]] = None
+    ) -> Tuple[str, Optional[str]]:
+        """Run a text completion request; returns the text and the finish reason."""
+        def accept(response):
+            reason = self._check_response(response)
+            if reason is None and validator is not None:
+                reason = validator(response.text)
+            return reason
+        
+        try:
+            response = self._generate("text_to_text", prompt, stage, accept, on_chunk)
+            return response.text, self._finish_reason(response)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            return f"Error in text_to_text: {str(e)}", None
+    
+    def _text_to_json(self, prompt: str, schema: dict, stage: str) -> Tuple[dict, Optional[str]]:
+        """Run a structured JSON request; returns the result and the finish reason."""
+        def accept(response):
+            reason = self._check_response(response)
+            if reason is None:
+                parsed = self._parse_json(response.text)
+                if parsed is None:
+                    reason = "parse_error"
+                elif not self._matches_schema(parsed, schema):
+                    reason = "schema"
+            return reason
+        
+        try:
             # Enhanced prompt for JSON generation
             json_prompt = f"""
 {prompt}
@@ -59,38 +488,40 @@ Please respond with valid JSON that matches this schema:
 Response (JSON only):
 """
             
-            response = self.model.generate_content(json_prompt)
+            response = self._generate("text_to_json", json_prompt, stage, accept)
             
             # Try to parse JSON
-            try:
-                return json.loads(response.text)
-            except json.JSONDecodeError:
+            result = self._parse_json(response.text)
+            if result is None:
                 # If JSON parsing fails, return error structure
                 return {
                     "error": "Failed to parse JSON response",
                     "raw_response": response.text
-                }
+                }, None
+            return result, self._finish_reason(response)
                 
         except Exception as e:
             return {
                 "error": f"Error in text_to_json: {str(e)}"
-            }
+            }, None
     
-    def text_to_function_call(self, prompt: str, functions: List[dict]) -> dict:
-        """
-        Generate function call in Vertex AI style.
+    def _text_to_function_call(self, prompt: str, functions: List[dict], stage: str) -> Tuple[dict, Optional[str]]:
+        """Run a function calling request; returns the result and the finish reason."""
+        function_names = {function.get("name") for function in functions}
+        
+        def accept(response):
+            reason = self._check_response(response)
+            if reason is None:
+                parsed = self._parse_json(response.text)
+                if not isinstance(parsed, dict):
+                    reason = "parse_error"
+                elif parsed.get("function_name") not in function_names | {None}:
+                    reason = "schema"
+                elif parsed.get("function_name") and not isinstance(parsed.get("parameters"), dict):
+                    reason = "schema"
+            return reason
         
-        Args:
-            prompt: Input text prompt
-            functions: List of available function definitions
-            
-        Returns:
-            Function call specification
-        """
         try:
-            # Rate limiting - 1 second between calls
-            time.sleep(1)
-            
             # Create function calling prompt
             functions_text = json.dumps(functions, indent=2)
             function_prompt = f"""
@@ -108,26 +539,99 @@ If no function is needed, respond with:
 Response (JSON only):
 """
             
-            response = self.model.generate_content(function_prompt)
+            response = self._generate("text_to_function_call", function_prompt, stage, accept)
             
             # Try to parse JSON
-            try:
-                result = json.loads(response.text)
-                return result
-            except json.JSONDecodeError:
+            result = self._parse_json(response.text)
+            if result is None:
                 return {
                     "function_name": None,
                     "parameters": None,
                     "error": "Failed to parse function call response",
                     "raw_response": response.text
-                }
+                }, None
+            return result, self._finish_reason(response)
                 
         except Exception as e:
             return {
                 "function_name": None,
                 "parameters": None,
                 "error": f"Error in text_to_function_call: {str(e)}"
-            }
+            }, None
+    
+    @staticmethod
+    def _is_cacheable(entry: List[Any]) -> bool:
+        """Only successful results the model finished normally go into the shared cache."""
+        result, finish_reason = entry
+        if finish_reason not in CACHEABLE_FINISH_REASONS:
+            return False
+        if isinstance(result, str):
+            return not result.startswith("Error in ")
+        return isinstance(result, dict) and "error" not in result
+    
+    @staticmethod
+    def _finish_reason(response: Any) -> Optional[str]:
+        """Get the name of a response's finish reason, if it has a candidate."""
+        candidates = getattr(response, "candidates", None) or []
+        if not candidates:
+            return None
+        reason = candidates[0].finish_reason
+        return getattr(reason, "name", str(reason))
+    
+    @staticmethod
+    def _is_quota_error(error: Exception) -> bool:
+        """Whether an API error means the quota is exhausted (HTTP 429)."""
+        return type(error).__name__ in ("ResourceExhausted", "TooManyRequests") or "429" in str(error)
+    
+    @staticmethod
+    def _check_response(response: Any) -> Optional[str]:
+        """Get an escalation reason for an empty, truncated or low-confidence response."""
+        candidates = getattr(response, "candidates", None) or []
+        if not candidates:
+            return "empty"
+        candidate = candidates[0]
+        if CustomGeminiLLM._finish_reason(response) not in NORMAL_FINISH_REASONS:
+            return "low_confidence"
+        avg_logprobs = getattr(candidate, "avg_logprobs", None)
+        if avg_logprobs and avg_logprobs < LOW_CONFIDENCE_LOGPROB:
+            return "low_confidence"
+        try:
+            if not response.text.strip():
+                return "empty"
+        except ValueError:
+            # .text raises when the candidate has no text parts
+            return "empty"
+        return None
+    
+    @staticmethod
+    def _parse_json(text: str) -> Any:
+        """Parse JSON, tolerating markdown code fences; None if it is not valid JSON."""
+        cleaned = text.strip()
+        if cleaned.startswith("```"):
+            cleaned = cleaned.strip("`")
+            if cleaned.lower().startswith("json"):
+                cleaned = cleaned[4:]
+        try:
+            return json.loads(cleaned)
+        except json.JSONDecodeError:
+            return None
+    
+    @staticmethod
+    def _matches_schema(value: Any, schema: dict) -> bool:
+        """Check required keys and top-level property types against a JSON schema."""
+        expected = schema.get("type")
+        if expected is not None:
+            types = expected if isinstance(expected, list) else [expected]
+            python_types = tuple(t for name in types for t in JSON_TYPES.get(name, (object,)))
+            if not isinstance(value, python_types):
+                return False
+        if isinstance(value, dict):
+            if any(key not in value for key in schema.get("required", [])):
+                return False
+            for key, prop in schema.get("properties", {}).items():
+                if key in value and isinstance(prop, dict) and not CustomGeminiLLM._matches_schema(value[key], prop):
+                    return False
+        return True
 
 
 if __name__ == "__main__":
@@ -1,21 +1,38 @@
 """LangChain adapter for the custom 3-method Gemini LLM."""
 
-from typing import Any, Dict, List, Optional
+import asyncio
+from typing import Any, Callable, Dict, List, Optional
 from langchain_core.language_models.llms import LLM
-from langchain_core.callbacks.manager import CallbackManagerForLLMRun
+from langchain_core.callbacks.manager import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
 from pydantic import Field
+from utils.cassette import Cassette
+from utils.single_flight import SingleFlight
 from .custom_gemini import CustomGeminiLLM
 
 
+# Identical concurrent prompts on an event loop share one worker thread. Counted
+# apart from llm_flight, which the shared thread's text_to_text call then goes through.
+llm_async_flight = SingleFlight()
+
+
 class LangChainGeminiAdapter(LLM):
     """LangChain-compatible wrapper for CustomGeminiLLM."""
     
     custom_llm: CustomGeminiLLM = Field(default=None, exclude=True)
     api_key: str = Field(default=None, exclude=True)
+    # Escalation reason (or None) for a routing-stage ReAct step; escalated steps are redone by the next tier
+    output_validator: Optional[Callable[[str], Optional[str]]] = Field(default=None, exclude=True)
+    # Creates a per-call on_chunk handler; when set, responses are streamed and may be cut short
+    chunk_handler_factory: Optional[Callable[[], Callable[[str], Optional[int]]]] = Field(
+        default=None, exclude=True
+    )
     
-    def __init__(self, api_key: str, **kwargs):
+    def __init__(self, api_key: str, cassette: Optional[Cassette] = None, **kwargs):
         super().__init__(api_key=api_key, **kwargs)
-        self.custom_llm = CustomGeminiLLM(api_key)
+        self.custom_llm = CustomGeminiLLM(api_key, cassette=cassette)
     
     def _call(
         self,
@@ -25,7 +42,50 @@ class LangChainGeminiAdapter(LLM):
         **kwargs: Any,
     ) -> str:
         """Standard LangChain _call method using our custom LLM."""
-        return self.custom_llm.text_to_text(prompt)
+        stage = self._stage_for(prompt)
+        return self.custom_llm.text_to_text(
+            prompt,
+            stage=stage,
+            validator=self._validator_for(stage),
+            on_chunk=self._chunk_handler()
+        )
+    
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        """Async _call; identical concurrent prompts on the loop share one worker thread."""
+        stage = self._stage_for(prompt)
+        return await llm_async_flight.do_async(
+            ("text_to_text", stage, prompt),
+            lambda: asyncio.to_thread(
+                self.custom_llm.text_to_text, prompt, stage, self._validator_for(stage), self._chunk_handler()
+            )
+        )
+    
+    def _validator_for(self, stage: str) -> Optional[Callable[[str], Optional[str]]]:
+        """Only routing output is judged; later steps already run on the strong model."""
+        return self.output_validator if stage == "routing" else None
+    
+    def _chunk_handler(self) -> Optional[Callable[[str], Optional[int]]]:
+        """Create this call's stream handler, if streaming is enabled."""
+        if self.chunk_handler_factory is None:
+            return None
+        return self.chunk_handler_factory()
+    
+    @staticmethod
+    def _stage_for(prompt: str) -> str:
+        """
+        Pick the cascade stage for a ReAct prompt.
+        
+        Before any tool has run the model is mostly routing to a tool; once the
+        scratchpad holds an Observation it is composing the final answer.
+        """
+        scratchpad = prompt.rpartition("Begin!")[2]
+        return "final_answer" if "Observation:" in scratchpad else "routing"
     
     @property
     def _llm_type(self) -> str:
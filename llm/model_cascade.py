@@ -0,0 +1,146 @@
+"""Model cascade: try a cheaper model first and escalate when its output is not good enough."""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+DEFAULT_MODEL = "gemini-1.5-flash"
+FAST_MODEL = "gemini-1.5-flash-8b"
+
+# Ordered model tiers per stage (cheapest first, strongest last)
+STAGE_MODELS = {
+    "routing": [FAST_MODEL, DEFAULT_MODEL],
+    "parse_recovery": [FAST_MODEL, DEFAULT_MODEL],
+    "summarization": [FAST_MODEL, DEFAULT_MODEL],
+    "final_answer": [DEFAULT_MODEL],
+}
+
+# Stage used by each CustomGeminiLLM method when the caller does not name one
+METHOD_STAGES = {
+    "text_to_text": "final_answer",
+    "text_to_json": "routing",
+    "text_to_function_call": "routing",
+}
+
+
+class ModelCascade:
+    """
+    Per-stage model selection with escalation on unacceptable output.
+
+    Each stage maps to an ordered list of models. A call runs on the first
+    model; if the acceptance check returns an escalation reason (for example
+    "parse_error", "schema" or "low_confidence") or the call raises, the next
+    model is tried. The last model's result is always returned.
+    """
+
+    def __init__(
+        self,
+        stage_models: Optional[Dict[str, List[str]]] = None,
+        method_stages: Optional[Dict[str, str]] = None,
+        default_model: str = DEFAULT_MODEL
+    ):
+        """Initialize the cascade with stage tiers and method defaults."""
+        self.stage_models = dict(STAGE_MODELS if stage_models is None else stage_models)
+        self.method_stages = dict(METHOD_STAGES if method_stages is None else method_stages)
+        self.default_model = default_model
+        self._lock = threading.Lock()
+        self._tier_stats: Dict[str, Dict[str, Any]] = {}
+        self._stage_stats: Dict[str, Dict[str, int]] = {}
+        self._escalations: Dict[str, int] = {}
+
+    def resolve_stage(self, method: str, stage: Optional[str] = None) -> str:
+        """Get the stage for a call, falling back to the method's default stage."""
+        return stage or self.method_stages.get(method, "final_answer")
+
+    def models_for(self, stage: str) -> List[str]:
+        """Get the ordered model tiers for a stage."""
+        return self.stage_models.get(stage) or [self.default_model]
+
+    def run(
+        self,
+        stage: str,
+        call: Callable[[str], Any],
+        accept: Callable[[Any], Optional[str]],
+        pace: Optional[Callable[[], None]] = None
+    ) -> Any:
+        """
+        Run a call through the stage's model tiers.
+
+        Args:
+            stage: Stage name used to pick the model tiers
+            call: Function taking a model name and returning a response
+            accept: Function returning None to accept a response or an escalation reason
+            pace: Optional rate-limiting hook run before each attempt (not timed)
+
+        Returns:
+            The first accepted response, or the last tier's response
+        """
+        models = self.models_for(stage)
+        escalated = False
+        for index, model_name in enumerate(models):
+            is_last = index == len(models) - 1
+            if pace is not None:
+                pace()
+            start = time.perf_counter()
+            try:
+                response = call(model_name)
+            except Exception:
+                self._record_call(model_name, time.perf_counter() - start, error=True)
+                if is_last:
+                    self._record_stage(stage, escalated)
+                    raise
+                self._record_escalation(stage, "error")
+                escalated = True
+                continue
+            self._record_call(model_name, time.perf_counter() - start)
+
+            reason = None if is_last else accept(response)
+            if reason is None:
+                self._record_stage(stage, escalated)
+                return response
+            self._record_escalation(stage, reason)
+            escalated = True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get per-tier latency and per-stage escalation counters."""
+        with self._lock:
+            tiers = {}
+            for model_name, stats in self._tier_stats.items():
+                tiers[model_name] = dict(stats)
+                tiers[model_name]["avg_latency_s"] = round(
+                    stats["total_latency_s"] / stats["calls"], 4
+                ) if stats["calls"] else 0.0
+            stages = {}
+            for stage, stats in self._stage_stats.items():
+                stages[stage] = dict(stats)
+                stages[stage]["escalation_rate"] = round(
+                    stats["escalated"] / stats["calls"], 4
+                ) if stats["calls"] else 0.0
+            return {
+                "tiers": tiers,
+                "stages": stages,
+                "escalation_reasons": dict(self._escalations),
+            }
+
+    def _record_call(self, model_name: str, latency: float, error: bool = False) -> None:
+        with self._lock:
+            stats = self._tier_stats.setdefault(
+                model_name, {"calls": 0, "errors": 0, "total_latency_s": 0.0}
+            )
+            stats["calls"] += 1
+            stats["total_latency_s"] += latency
+            if error:
+                stats["errors"] += 1
+
+    def _record_stage(self, stage: str, escalated: bool) -> None:
+        with self._lock:
+            stats = self._stage_stats.setdefault(stage, {"calls": 0, "escalated": 0})
+            stats["calls"] += 1
+            if escalated:
+                stats["escalated"] += 1
+
+    def _record_escalation(self, stage: str, reason: str) -> None:
+        key = f"{stage}:{reason}"
+        with self._lock:
+            self._escalations[key] = self._escalations.get(key, 0) + 1
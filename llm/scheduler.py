@@ -0,0 +1,269 @@
+"""Priority- and fairness-aware scheduling of Gemini calls across sessions."""
+
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from utils.deadline import Deadline, DeadlineExceeded
+
+
+INTERACTIVE = "interactive"
+SUMMARIZATION = "summarization"
+BATCH = "batch"
+
+# Share of call slots each session of a class gets relative to the others
+CLASS_WEIGHTS = {
+    INTERACTIVE: 8.0,
+    SUMMARIZATION: 2.0,
+    BATCH: 1.0,
+}
+
+# Default class per cascade stage; anything else runs as interactive
+STAGE_CLASSES = {
+    "summarization": SUMMARIZATION,
+}
+
+# Upper bounds (ms) of the queue-wait histogram buckets
+WAIT_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+# Smoothing of the measured slot hold time used for admission estimates
+SERVICE_EWMA_ALPHA = 0.2
+
+# Flows not seen for this many dispatches are forgotten
+FLOW_RETENTION = 1000
+
+_current_class: contextvars.ContextVar = contextvars.ContextVar("priority_class", default=None)
+
+
+class SchedulerRejected(DeadlineExceeded):
+    """Raised when a call's expected queue wait would break its deadline."""
+
+
+@contextmanager
+def priority_scope(priority_class: str) -> Iterator[None]:
+    """Run the LLM calls of the enclosed block in a priority class, e.g. BATCH for offline jobs."""
+    if priority_class not in CLASS_WEIGHTS:
+        raise ValueError(f"Unknown priority class: {priority_class}")
+    token = _current_class.set(priority_class)
+    try:
+        yield
+    finally:
+        _current_class.reset(token)
+
+
+def resolve_class(stage: Optional[str] = None) -> str:
+    """Get the priority class of a call: the active priority_scope, else the stage default."""
+    return _current_class.get() or STAGE_CLASSES.get(stage, INTERACTIVE)
+
+
+class _Ticket:
+    """A queued call."""
+
+    def __init__(self, priority_class: str, session: str, finish_tag: float, start_tag: float):
+        self.priority_class = priority_class
+        self.session = session
+        self.finish_tag = finish_tag
+        self.start_tag = start_tag
+        self.enqueued_at = time.monotonic()
+        self.cancelled = False
+
+
+class LLMScheduler:
+    """
+    Weighted fair queue in front of the Gemini call slots.
+
+    Every (class, session) pair is a flow. Flows are served in order of
+    virtual finish time, so each session gets a share of slots proportional
+    to its class weight: a burst from one batch job queues behind itself
+    instead of in front of interactive users, and two interactive sessions
+    split their class's share evenly.
+
+    Admission control estimates a new call's queue wait from the calls that
+    would be served before it and the measured slot hold time. A call whose
+    estimate exceeds the time left on its deadline is rejected at once, so
+    the agent can answer best-effort instead of waiting to time out. Calls
+    without a deadline are always admitted and simply wait their turn.
+    """
+
+    def __init__(self, capacity: int = 1, weights: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            capacity: Calls allowed to hold a slot at once
+            weights: Class weights (defaults to CLASS_WEIGHTS)
+        """
+        self.capacity = capacity
+        self.weights = dict(weights or CLASS_WEIGHTS)
+        self._cond = threading.Condition()
+        self._queue: List[tuple] = []
+        self._sequence = itertools.count()
+        self._flow_finish: Dict[tuple, float] = {}
+        self._virtual_time = 0.0
+        self._running = 0
+        self._service_s: Optional[float] = None
+        self._stats = {
+            name: {"admitted": 0, "rejected": 0, "timed_out": 0, "buckets": [0] * (len(WAIT_BUCKETS_MS) + 1)}
+            for name in self.weights
+        }
+
+    @contextmanager
+    def slot(
+        self,
+        priority_class: str = INTERACTIVE,
+        session: str = "default",
+        deadline: Optional[Deadline] = None
+    ) -> Iterator[None]:
+        """
+        Hold a call slot for the enclosed block, waiting for this call's turn.
+
+        Args:
+            priority_class: INTERACTIVE, SUMMARIZATION or BATCH
+            session: Session the call belongs to (the fairness unit)
+            deadline: Request deadline used for admission control and as the wait limit
+
+        Raises:
+            SchedulerRejected: The expected wait would overrun the deadline
+            DeadlineExceeded: The deadline passed while waiting
+        """
+        ticket = self._enqueue(priority_class, session, deadline)
+        self._wait_turn(ticket, deadline)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - start)
+
+    def estimated_wait(self, priority_class: str = INTERACTIVE, session: str = "default") -> float:
+        """Expected seconds a call submitted now would wait for a slot."""
+        with self._cond:
+            _, finish_tag = self._tags(priority_class, session)
+            return self._estimate(finish_tag)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get per-class admission counters and queue-wait histograms."""
+        with self._cond:
+            stats = {}
+            for name, counters in self._stats.items():
+                buckets = counters["buckets"]
+                labels = [f"<={bound}ms" for bound in WAIT_BUCKETS_MS] + [f">{WAIT_BUCKETS_MS[-1]}ms"]
+                stats[name] = {
+                    "admitted": counters["admitted"],
+                    "rejected": counters["rejected"],
+                    "timed_out": counters["timed_out"],
+                    "queued": sum(1 for _, _, t in self._queue if t.priority_class == name and not t.cancelled),
+                    "wait_p50_ms": self._percentile(buckets, 0.50),
+                    "wait_p95_ms": self._percentile(buckets, 0.95),
+                    "wait_histogram": {label: n for label, n in zip(labels, buckets) if n},
+                }
+            return stats
+
+    def _enqueue(self, priority_class: str, session: str, deadline: Optional[Deadline]) -> _Ticket:
+        """Admit a call into the queue, or reject it if it cannot be served in time."""
+        if priority_class not in self.weights:
+            raise ValueError(f"Unknown priority class: {priority_class}")
+        with self._cond:
+            start_tag, finish_tag = self._tags(priority_class, session)
+            if deadline is not None:
+                expected = self._estimate(finish_tag)
+                if expected > deadline.remaining():
+                    self._stats[priority_class]["rejected"] += 1
+                    raise SchedulerRejected(
+                        f"expected queue wait of {expected:.1f}s exceeds the "
+                        f"{max(deadline.remaining(), 0.0):.1f}s left on the request deadline"
+                    )
+            ticket = _Ticket(priority_class, session, finish_tag, start_tag)
+            self._flow_finish[(priority_class, session)] = finish_tag
+            heapq.heappush(self._queue, (finish_tag, next(self._sequence), ticket))
+            self._stats[priority_class]["admitted"] += 1
+            return ticket
+
+    def _wait_turn(self, ticket: _Ticket, deadline: Optional[Deadline]) -> None:
+        """Block until the ticket is at the head of the queue and a slot is free."""
+        with self._cond:
+            try:
+                while True:
+                    self._drop_cancelled()
+                    if self._queue[0][2] is ticket and self._running < self.capacity:
+                        heapq.heappop(self._queue)
+                        self._running += 1
+                        self._virtual_time = max(self._virtual_time, ticket.start_tag)
+                        self._prune_flows()
+                        break
+                    timeout = deadline.timeout() if deadline is not None else None
+                    if timeout is not None and timeout <= 0:
+                        self._stats[ticket.priority_class]["timed_out"] += 1
+                        raise DeadlineExceeded("request deadline passed while queued for an LLM slot")
+                    self._cond.wait(timeout)
+            except BaseException:
+                # Any abandoned wait (deadline, KeyboardInterrupt, ...) must not block the calls behind it
+                ticket.cancelled = True
+                self._cond.notify_all()
+                raise
+
+            waited = time.monotonic() - ticket.enqueued_at
+            self._observe_wait(ticket.priority_class, waited)
+        if deadline is not None:
+            deadline.spend("llm_queue", waited)
+
+    def _release(self, held_s: float) -> None:
+        """Free a slot and let the next call in."""
+        with self._cond:
+            self._running -= 1
+            if self._service_s is None:
+                self._service_s = held_s
+            else:
+                self._service_s += SERVICE_EWMA_ALPHA * (held_s - self._service_s)
+            self._cond.notify_all()
+
+    def _tags(self, priority_class: str, session: str) -> tuple:
+        """Virtual start and finish tags a new call of this flow would get."""
+        start_tag = max(self._virtual_time, self._flow_finish.get((priority_class, session), 0.0))
+        return start_tag, start_tag + 1.0 / self.weights[priority_class]
+
+    def _estimate(self, finish_tag: float) -> float:
+        """Expected wait of a call with this finish tag, from the calls ahead of it."""
+        if self._service_s is None:
+            return 0.0
+        ahead = sum(1 for tag, _, t in self._queue if tag <= finish_tag and not t.cancelled)
+        waiting_for_slot = max(self._running + ahead - self.capacity + 1, 0)
+        return waiting_for_slot * self._service_s / self.capacity
+
+    def _drop_cancelled(self) -> None:
+        while self._queue and self._queue[0][2].cancelled:
+            heapq.heappop(self._queue)
+
+    def _prune_flows(self) -> None:
+        """Forget idle flows; their next call starts at the current virtual time anyway."""
+        if len(self._flow_finish) > FLOW_RETENTION:
+            self._flow_finish = {
+                flow: tag for flow, tag in self._flow_finish.items() if tag > self._virtual_time
+            }
+
+    def _observe_wait(self, priority_class: str, waited_s: float) -> None:
+        waited_ms = waited_s * 1000
+        buckets = self._stats[priority_class]["buckets"]
+        for index, bound in enumerate(WAIT_BUCKETS_MS):
+            if waited_ms <= bound:
+                buckets[index] += 1
+                return
+        buckets[-1] += 1
+
+    @staticmethod
+    def _percentile(buckets: List[int], pct: float) -> Optional[float]:
+        """Upper bucket bound (ms) below which pct of the waits fall."""
+        total = sum(buckets)
+        if not total:
+            return None
+        running = 0
+        for index, count in enumerate(buckets):
+            running += count
+            if running >= pct * total:
+                return float(WAIT_BUCKETS_MS[index]) if index < len(WAIT_BUCKETS_MS) else float("inf")
+        return float("inf")
+
+
+# Process-wide scheduler; the rate limiter hands out one Gemini slot at a time
+llm_scheduler = LLMScheduler()
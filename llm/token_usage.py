@@ -0,0 +1,240 @@
+"""Token accounting from Gemini usage metadata, with per-session budgets."""
+
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+
+# Rough characters per token, for estimates made before a call
+CHARS_PER_TOKEN = 4
+
+# Prompt section markers of REACT_AGENT_PROMPT, in order
+SECTION_MARKERS = [
+    ("history", "CONVERSATION HISTORY:"),
+    ("tools", "TOOLS:"),
+    ("instructions", "Use the following format"),
+    ("question", "Current Question:"),
+]
+
+# Per-call records kept for inspection
+RECENT_CALLS = 1000
+
+GROUP_FIELDS = ("session", "method", "model", "stage", "iteration")
+
+_usage_context: contextvars.ContextVar = contextvars.ContextVar("usage_context", default=None)
+
+
+class UsageContext:
+    """Attribution labels for the LLM calls made while it is active."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.iteration = 0
+
+
+@contextmanager
+def usage_scope(session_id: str) -> Iterator[UsageContext]:
+    """Attribute LLM calls in the enclosed block to a session."""
+    context = UsageContext(session_id)
+    token = _usage_context.set(context)
+    try:
+        yield context
+    finally:
+        _usage_context.reset(token)
+
+
+def get_usage_context() -> Optional[UsageContext]:
+    """Get the attribution context of the running request, if any."""
+    return _usage_context.get()
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of text without calling the API."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_prompt_sections(prompt: str) -> Dict[str, int]:
+    """
+    Measure the characters of each ReAct prompt section.
+
+    Returns:
+        Characters per section: history, tools, instructions, question,
+        scratchpad, and other for anything outside the known markers
+    """
+    positions = []
+    for name, marker in SECTION_MARKERS:
+        index = prompt.find(marker)
+        if index >= 0:
+            positions.append((index, name))
+    if not positions:
+        return {"other": len(prompt)}
+
+    # The scratchpad follows the "Thought:" that ends the question section
+    question_at = prompt.find("Current Question:")
+    if question_at >= 0:
+        thought_at = prompt.find("\nThought:", question_at)
+        if thought_at >= 0:
+            positions.append((thought_at + len("\nThought:"), "scratchpad"))
+
+    positions.sort()
+    sections = {"other": positions[0][0]}
+    for (start, name), (end, _) in zip(positions, positions[1:] + [(len(prompt), None)]):
+        sections[name] = sections.get(name, 0) + end - start
+    return sections
+
+
+class TokenLedger:
+    """
+    Aggregates token usage per session, method, model, stage and ReAct iteration.
+
+    Input tokens are additionally split across prompt sections in proportion
+    to their share of the prompt's characters. Sessions can be given token
+    budgets that the agent enforces.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[tuple, Dict[str, Any]] = {}
+        self._sessions: Dict[str, Dict[str, int]] = {}
+        self._budgets: Dict[str, int] = {}
+        self._recent = deque(maxlen=RECENT_CALLS)
+
+    def record(
+        self,
+        method: str,
+        model: str,
+        stage: str,
+        prompt: str,
+        input_tokens: int,
+        output_tokens: int
+    ) -> None:
+        """
+        Record one generate_content call, attributed to the current usage context.
+
+        Args:
+            method: CustomGeminiLLM method
+            model: Model that served the call
+            stage: Cascade stage
+            prompt: Prompt sent (used for the section breakdown)
+            input_tokens: Prompt tokens reported by the API
+            output_tokens: Candidate tokens reported by the API
+        """
+        context = get_usage_context()
+        session = context.session_id if context else None
+        iteration = context.iteration if context else None
+
+        section_chars = split_prompt_sections(prompt)
+        total_chars = sum(section_chars.values()) or 1
+        sections = {
+            name: round(input_tokens * chars / total_chars)
+            for name, chars in section_chars.items() if chars
+        }
+
+        key = (session, method, model, stage, iteration)
+        with self._lock:
+            totals = self._totals.setdefault(
+                key, {"calls": 0, "input_tokens": 0, "output_tokens": 0, "sections": {}}
+            )
+            totals["calls"] += 1
+            totals["input_tokens"] += input_tokens
+            totals["output_tokens"] += output_tokens
+            for name, tokens in sections.items():
+                totals["sections"][name] = totals["sections"].get(name, 0) + tokens
+
+            if session is not None:
+                usage = self._sessions.setdefault(session, {"input_tokens": 0, "output_tokens": 0})
+                usage["input_tokens"] += input_tokens
+                usage["output_tokens"] += output_tokens
+
+            self._recent.append({
+                "time": time.time(),
+                "session": session,
+                "method": method,
+                "model": model,
+                "stage": stage,
+                "iteration": iteration,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "sections": sections,
+            })
+
+    def query(
+        self,
+        session_id: Optional[str] = None,
+        group_by: Sequence[str] = ("method",)
+    ) -> List[Dict[str, Any]]:
+        """
+        Aggregate recorded usage.
+
+        Args:
+            session_id: Only include this session (None = all sessions)
+            group_by: Any of 'session', 'method', 'model', 'stage', 'iteration'
+
+        Returns:
+            One row per group with calls, input/output tokens and per-section input tokens
+        """
+        unknown = set(group_by) - set(GROUP_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown group_by fields: {sorted(unknown)}")
+
+        rows: Dict[tuple, Dict[str, Any]] = {}
+        with self._lock:
+            for key, totals in self._totals.items():
+                labels = dict(zip(GROUP_FIELDS, key))
+                if session_id is not None and labels["session"] != session_id:
+                    continue
+                group = tuple(labels[field] for field in group_by)
+                row = rows.setdefault(group, {
+                    **{field: labels[field] for field in group_by},
+                    "calls": 0, "input_tokens": 0, "output_tokens": 0, "sections": {},
+                })
+                row["calls"] += totals["calls"]
+                row["input_tokens"] += totals["input_tokens"]
+                row["output_tokens"] += totals["output_tokens"]
+                for name, tokens in totals["sections"].items():
+                    row["sections"][name] = row["sections"].get(name, 0) + tokens
+        return list(rows.values())
+
+    def recent_calls(self, session_id: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Get the most recent per-call records, newest last."""
+        with self._lock:
+            calls = [c for c in self._recent if session_id is None or c["session"] == session_id]
+        return calls[-limit:]
+
+    def session_usage(self, session_id: str) -> Dict[str, int]:
+        """Get a session's input, output and total tokens."""
+        with self._lock:
+            usage = dict(self._sessions.get(session_id, {"input_tokens": 0, "output_tokens": 0}))
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        return usage
+
+    def set_budget(self, session_id: str, max_tokens: Optional[int]) -> None:
+        """Set (or clear with None) a session's total token budget."""
+        with self._lock:
+            if max_tokens is None:
+                self._budgets.pop(session_id, None)
+            else:
+                self._budgets[session_id] = max_tokens
+
+    def remaining_budget(self, session_id: str) -> Optional[int]:
+        """Tokens left in a session's budget (None when it has no budget)."""
+        with self._lock:
+            budget = self._budgets.get(session_id)
+        if budget is None:
+            return None
+        return budget - self.session_usage(session_id)["total_tokens"]
+
+    def clear_session(self, session_id: str) -> None:
+        """Forget a session's usage and budget."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._budgets.pop(session_id, None)
+            for key in [key for key in self._totals if key[0] == session_id]:
+                del self._totals[key]
+
+
+# Process-wide ledger shared by all LLM instances
+token_ledger = TokenLedger()
@@ -3,6 +3,8 @@
 import os
 from dotenv import load_dotenv
 from agent.langchain_agent import LangChainAgent
+from tools.langchain_tools import set_tool_cassette
+from utils.cassette import Cassette
 
 
 def print_help():
@@ -11,11 +13,23 @@ def print_help():
     print("• Ask any question (the agent will remember context)")
     print("• 'help' - Show this help message")
     print("• 'history' - Show conversation history")
+    print("• 'stats' - Show performance statistics")
     print("• 'clear' - Clear conversation history")
     print("• 'new' - Start a new conversation (clears history)")
     print("• 'quit' or 'exit' - End the session")
 
 
+def print_stats(stats):
+    """Print performance statistics grouped by component."""
+    print("\n📊 Performance Statistics:")
+    for component, values in stats.items():
+        print(f"• {component}:")
+        if not values:
+            print("    (no data yet)")
+        for key, value in values.items():
+            print(f"    {key}: {value}")
+
+
 def main():
     """Main CLI interface with conversation memory management."""
     print("🦜 LangChain Q&A Agent with Custom Gemini LLM + Memory")
@@ -31,9 +45,26 @@ def main():
         print("Please set your Gemini API key in a .env file or as an environment variable.")
         return
     
+    # Optionally record LLM and tool traffic for offline replay (see replay.py)
+    cassette = None
+    cassette_path = os.getenv("AGENT_CASSETTE")
+    if cassette_path:
+        cassette = Cassette(cassette_path, mode="record")
+        set_tool_cassette(cassette)
+        print(f"📼 Recording LLM and tool traffic to {cassette_path}")
+    
     # Initialize LangChain agent
     try:
-        agent = LangChainAgent(api_key)
+        deadline = os.getenv("AGENT_REQUEST_DEADLINE_S")
+        token_budget = os.getenv("AGENT_TOKEN_BUDGET")
+        long_term_memory = os.getenv("AGENT_LONG_TERM_MEMORY", "").lower() in ("1", "true", "yes")
+        agent = LangChainAgent(
+            api_key,
+            cassette=cassette,
+            request_deadline_s=float(deadline) if deadline else None,
+            token_budget=int(token_budget) if token_budget else None,
+            long_term_memory=long_term_memory
+        )
         print("✅ LangChain Agent initialized successfully!")
         
         print("\n🛠️ Available tools:")
@@ -88,6 +119,10 @@ def main():
                     agent.show_conversation_history()
                     continue
                 
+                elif question.lower() in ['stats']:
+                    print_stats(agent.get_performance_stats())
+                    continue
+                
                 elif question.lower() in ['clear', 'reset']:
                     agent.end_conversation()
                     agent.init_conversation()
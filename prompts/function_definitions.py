@@ -124,4 +124,16 @@ FUNCTION_DESCRIPTIONS = {
     "wikipedia": "Search Wikipedia for encyclopedic information about people, places, concepts, and events",
     "arxiv": "Search arXiv for academic papers and research publications",
     "python_repl_ast": "Execute Python code for complex calculations, data analysis, or programming tasks"
-} 
\ No newline at end of file
+} 
+
+# Typical question vocabulary per function, used to pick the tools offered for a question
+FUNCTION_KEYWORDS = {
+    # Custom tools
+    "web_search": "latest news today current price weather stock bitcoin score recent update who won release website online",
+    "calculator": "calculate compute math percent percentage sum total multiply divide add subtract square root power plus minus times how much 0 + - * / % ^",
+    "get_datetime": "date time today now current day week month year clock timezone weekday what time when",
+    # Native LangChain tools
+    "wikipedia": "who was history historical biography president leader king queen country city capital population born died founded invented discovered war world cup championship olympics event century definition explain overview article famous",
+    "arxiv": "paper papers research study studies publication preprint journal authors scientific academic literature survey model",
+    "python_repl_ast": "code program script python function algorithm fibonacci prime sort list loop simulate data analysis plot statistics"
+}
@@ -0,0 +1,101 @@
+"""Replay recorded agent sessions from a cassette at N-times concurrency."""
+
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+from agent.langchain_agent import LangChainAgent
+from llm.token_usage import token_ledger
+from tools.langchain_tools import set_tool_cassette
+from utils.cassette import Cassette
+
+
+def load_sessions(cassette: Cassette) -> Dict[str, List[str]]:
+    """Group recorded questions by session, in recorded order."""
+    sessions: Dict[str, List[str]] = {}
+    for event in cassette.events("question"):
+        sessions.setdefault(event["session"], []).append(event["question"])
+    return sessions
+
+
+def load_settings(cassette: Cassette) -> Dict[str, Dict[str, Any]]:
+    """Get the agent settings each session was recorded with (none for older cassettes)."""
+    return {event["session"]: event["settings"] for event in cassette.events("session")}
+
+
+def replay_session(
+    api_key: str,
+    cassette: Cassette,
+    questions: List[str],
+    settings: Optional[Dict[str, Any]] = None
+) -> List[float]:
+    """Replay one session on a fresh agent built with its recorded settings and return per-question latencies."""
+    agent = LangChainAgent(api_key, cassette=cassette, verbose=False, **(settings or {}))
+    latencies = []
+    for question in questions:
+        start = time.perf_counter()
+        agent.answer_question(question)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def main():
+    """Replay every recorded session `concurrency` times in parallel and report latencies."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("cassette", help="Cassette file recorded with AGENT_CASSETTE")
+    parser.add_argument("-n", "--concurrency", type=int, default=1,
+                        help="Number of concurrent copies of each recorded session")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="Multiplier for recorded latencies (0 = no sleeps)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    # Replay never reaches Gemini, but the client still needs a key to configure
+    api_key = os.getenv("GEMINI_API_KEY", "replay")
+
+    cassette = Cassette(args.cassette, mode="replay", latency_scale=args.latency_scale)
+    set_tool_cassette(cassette)
+
+    sessions = load_sessions(cassette)
+    if not sessions:
+        print("❌ No recorded sessions found in cassette")
+        return
+
+    settings = load_settings(cassette)
+    jobs = [
+        (questions, settings.get(session))
+        for session, questions in sessions.items()
+        for _ in range(args.concurrency)
+    ]
+    print(f"📼 Replaying {len(sessions)} session(s) x{args.concurrency} "
+          f"({sum(len(questions) for questions, _ in jobs)} questions, latency scale {args.latency_scale})")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        results = list(pool.map(lambda job: replay_session(api_key, cassette, *job), jobs))
+    wall_time = time.perf_counter() - start
+
+    latencies = [latency for session in results for latency in session]
+    print(f"\n📊 Replay results ({wall_time:.2f}s wall time):")
+    print(f"• questions: {len(latencies)}")
+    print(f"• mean: {statistics.mean(latencies):.3f}s")
+    for pct in (50, 95, 99):
+        print(f"• p{pct}: {percentile(latencies, pct):.3f}s")
+    print(f"• max: {max(latencies):.3f}s")
+    print(f"• cassette: {cassette.get_stats()}")
+    for row in token_ledger.query(group_by=("model",)):
+        print(f"• tokens ({row['model']}): {row['input_tokens']} in / {row['output_tokens']} out")
+
+
+if __name__ == "__main__":
+    main()
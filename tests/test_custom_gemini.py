@@ -0,0 +1,155 @@
+"""Tests for the response cache and request coalescing in llm.custom_gemini."""
+
+import threading
+import time
+
+from llm.custom_gemini import CustomGeminiLLM, _RecordedResponse
+from utils.cassette import Cassette
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.shared_store import MemoryStore
+
+
+def make_llm(monkeypatch, finish_reason, cassette=None):
+    """LLM whose model calls are counted and answered with a fixed snapshot."""
+    llm = CustomGeminiLLM("test-key", cassette=cassette, store=MemoryStore())
+    llm.rate_limiter.interval = 0
+    calls = []
+
+    def call_model(model_name, prompt, options=None, on_chunk=None):
+        calls.append(model_name)
+        return _RecordedResponse({"text": f"answer to {prompt}", "finish_reason": finish_reason})
+
+    monkeypatch.setattr(llm, "_call_model", call_model)
+    return llm, calls
+
+
+def test_finished_answers_are_cached(monkeypatch):
+    llm, calls = make_llm(monkeypatch, "STOP")
+    assert llm.text_to_text("cached prompt") == "answer to cached prompt"
+    assert llm.text_to_text("cached prompt") == "answer to cached prompt"
+    assert len(calls) == 1
+
+
+def test_truncated_answers_are_not_cached(monkeypatch):
+    llm, calls = make_llm(monkeypatch, "MAX_TOKENS")
+    llm.text_to_text("truncated prompt")
+    first = len(calls)
+    llm.text_to_text("truncated prompt")
+    assert len(calls) == 2 * first
+    assert llm.get_cache_stats()["hits"] == 0
+
+
+def test_cassette_bypasses_the_cache(monkeypatch, tmp_path):
+    cassette = Cassette(str(tmp_path / "session.jsonl.gz"))
+    llm, calls = make_llm(monkeypatch, "STOP", cassette=cassette)
+    llm.text_to_text("recorded prompt")
+    llm.text_to_text("recorded prompt")
+    assert len(calls) == 2
+    assert llm.get_cache_stats() == {"hits": 0, "misses": 0}
+    cassette.close()
+
+
+def run_in_thread(llm, prompt, deadline, results, name):
+    """Call text_to_text under a deadline in a new thread, storing the result or exception."""
+    def run():
+        try:
+            with deadline.activate():
+                results[name] = llm.text_to_text(prompt)
+        except Exception as e:
+            results[name] = e
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_callers_with_different_deadlines_do_not_share_a_call(monkeypatch):
+    llm, calls = make_llm(monkeypatch, "STOP")
+    answer = llm._call_model
+
+    def slow_call_model(model_name, prompt, options=None, on_chunk=None):
+        time.sleep(0.2)
+        return answer(model_name, prompt, options, on_chunk)
+
+    monkeypatch.setattr(llm, "_call_model", slow_call_model)
+    results = {}
+    threads = [run_in_thread(llm, "deadline prompt", Deadline(0.3), results, "short")]
+    time.sleep(0.05)
+    threads.append(run_in_thread(llm, "deadline prompt", Deadline(None), results, "unbounded"))
+    for thread in threads:
+        thread.join()
+    assert results == {"short": "answer to deadline prompt", "unbounded": "answer to deadline prompt"}
+    # The unbounded caller did not get the request made under the short deadline
+    assert len(calls) == 2
+
+
+def test_follower_retries_when_the_leader_runs_out_of_time(monkeypatch):
+    llm, calls = make_llm(monkeypatch, "STOP")
+    answer = llm._call_model
+
+    def call_model(model_name, prompt, options=None, on_chunk=None):
+        time.sleep(0.2)
+        if len(calls) == 0:
+            calls.append(model_name)
+            raise DeadlineExceeded("no rate-limit slot before the request deadline")
+        return answer(model_name, prompt, options, on_chunk)
+
+    monkeypatch.setattr(llm, "_call_model", call_model)
+    results = {}
+    # Both have between 8 and 16 seconds left, so they share one call
+    threads = [run_in_thread(llm, "shared prompt", Deadline(15.0), results, "leader")]
+    time.sleep(0.05)
+    threads.append(run_in_thread(llm, "shared prompt", Deadline(14.0), results, "follower"))
+    for thread in threads:
+        thread.join()
+    assert isinstance(results["leader"], DeadlineExceeded)
+    assert results["follower"] == "answer to shared prompt"
+    assert llm.get_flight_stats()["coalesced"] >= 1
+
+
+class FakeChunk:
+    """One streamed chunk; the model has not finished while streaming."""
+
+    def __init__(self, text):
+        self.text = text
+        self.candidates = [type("Candidate", (), {"finish_reason": "FINISH_REASON_UNSPECIFIED", "avg_logprobs": None})()]
+        self.usage_metadata = None
+
+
+class StreamingModel:
+    """Model that streams a ReAct step followed by a hallucinated Observation."""
+
+    def __init__(self):
+        self.calls = 0
+        self.chunks_read = 0
+
+    def generate_content(self, prompt, stream=False, **options):
+        self.calls += 1
+        pieces = ["Action: wikipedia\n", "Action Input: Paris\n", "Observation: made up\n", "Final Answer: x"]
+        if not stream:
+            return _RecordedResponse({"text": "".join(pieces), "finish_reason": "STOP"})
+        return self._stream(pieces)
+
+    def _stream(self, pieces):
+        for piece in pieces:
+            self.chunks_read += 1
+            yield FakeChunk(piece)
+
+
+def test_cut_streams_are_labelled_and_cached_apart_from_whole_answers(monkeypatch):
+    llm = CustomGeminiLLM("test-key", store=MemoryStore())
+    llm.rate_limiter.interval = 0
+    model = StreamingModel()
+    monkeypatch.setattr(llm, "_get_model", lambda model_name: model)
+    cut_at_input = lambda text: text.index("Observation:") if "Observation:" in text else None
+
+    snapshot = llm._stream(model, "prompt", {}, cut_at_input)
+    assert snapshot["finish_reason"] == "STREAM_CUT"
+    assert snapshot["text"] == "Action: wikipedia\nAction Input: Paris\n"
+    assert model.chunks_read == 3
+
+    step = llm.text_to_text("react prompt", on_chunk=cut_at_input)
+    assert llm.text_to_text("react prompt", on_chunk=cut_at_input) == step
+    assert model.calls == 2
+    # A caller that does not stream must not be served the cut step
+    assert "Final Answer" in llm.text_to_text("react prompt")
+    assert model.calls == 3
@@ -0,0 +1,125 @@
+"""Tests for agent.executor."""
+
+import asyncio
+import time
+from typing import Any, List, Optional
+
+from langchain.agents import create_react_agent
+from langchain_core.agents import AgentAction
+from langchain_core.language_models.llms import LLM
+from langchain_core.prompts import PromptTemplate
+from langchain_core.tools import BaseTool
+
+from agent.executor import BEST_EFFORT_OBSERVATION_CHARS, BudgetedAgentExecutor, best_effort_answer
+from agent.output_parser import RobustReActOutputParser
+from llm.token_usage import token_ledger, usage_scope
+from utils.deadline import Deadline, DeadlineExceeded
+
+PROMPT = PromptTemplate.from_template("{tools}\n{tool_names}\n{input}\n{agent_scratchpad}")
+SEARCH_STEP = "Thought: look it up\nAction: lookup\nAction Input: paris"
+
+
+class LookupTool(BaseTool):
+    """Test tool returning a fixed fact."""
+
+    name: str = "lookup"
+    description: str = "Look up a fact"
+
+    def _run(self, query: str, run_manager=None) -> str:
+        return f"{query} is the capital of France"
+
+
+class ScriptedLLM(LLM):
+    """LLM replaying scripted outputs; an exception in the script is raised instead."""
+
+    script: List[Any]
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        step = self.script.pop(0)
+        if isinstance(step, Exception):
+            raise step
+        return step
+
+
+def make_executor(script, max_iterations=3):
+    tools = [LookupTool()]
+    agent = create_react_agent(
+        llm=ScriptedLLM(script=list(script)),
+        tools=tools,
+        prompt=PROMPT,
+        output_parser=RobustReActOutputParser(tool_names=["lookup"])
+    )
+    return BudgetedAgentExecutor(agent=agent, tools=tools, max_iterations=max_iterations)
+
+
+def test_best_effort_answer_quotes_distinct_observations():
+    lookup = AgentAction("lookup", "paris", "")
+    steps = [
+        (lookup, "Paris is the capital of France"),
+        (lookup, "Paris is the capital of France"),
+        (AgentAction("_Exception", "bad format", ""), "Invalid Format"),
+        (AgentAction("lookup", "long", ""), "x" * (BEST_EFFORT_OBSERVATION_CHARS + 50)),
+        (AgentAction("lookup", "empty", ""), "  "),
+    ]
+    answer = best_effort_answer(steps)
+    assert answer.count("From lookup (paris)") == 1
+    assert "_Exception" not in answer
+    assert "x" * BEST_EFFORT_OBSERVATION_CHARS + "..." in answer
+    assert "(empty)" not in answer
+    assert best_effort_answer([]).startswith("Sorry, I couldn't finish")
+
+
+def test_should_continue_checks_deadline_iterations_and_tokens():
+    executor = make_executor([], max_iterations=3)
+
+    deadline = Deadline(10.0)
+    with deadline.activate():
+        assert executor._should_continue(0, 0.0)
+        assert executor._should_continue(1, 0.0)
+        assert not executor._should_continue(3, 0.0)
+    assert deadline.best_effort
+
+    # The first iteration took 0.3s and only 0.2s are left: the next one would not fit
+    deadline = Deadline(0.5)
+    with deadline.activate():
+        assert executor._should_continue(0, 0.0)
+        time.sleep(0.3)
+        assert not executor._should_continue(1, 0.3)
+    assert deadline.best_effort
+
+    token_ledger.set_budget("spent-session", 10)
+    deadline = Deadline(None)
+    with deadline.activate(), usage_scope("spent-session"):
+        token_ledger.record("text_to_text", "model", "routing", "prompt", 8, 4)
+        assert executor._should_continue(0, 0.0)
+        assert not executor._should_continue(1, 0.0)
+    assert deadline.best_effort
+    token_ledger.clear_session("spent-session")
+
+
+def test_deadline_during_an_iteration_answers_best_effort():
+    executor = make_executor([SEARCH_STEP, DeadlineExceeded("no rate-limit slot before the request deadline")])
+    deadline = Deadline(30.0)
+    with deadline.activate():
+        result = executor.invoke({"input": "capital of France?"})
+    assert deadline.best_effort
+    assert "paris is the capital of France" in result["output"]
+    assert result["output"].startswith("I couldn't finish")
+
+
+def test_async_run_at_iteration_limit_answers_best_effort():
+    executor = make_executor([SEARCH_STEP], max_iterations=1)
+    deadline = Deadline(30.0)
+
+    async def run():
+        with deadline.activate():
+            return await executor.ainvoke({"input": "capital of France?"})
+
+    result = asyncio.run(run())
+    assert deadline.best_effort
+    assert "Agent stopped" not in result["output"]
+    assert "paris is the capital of France" in result["output"]
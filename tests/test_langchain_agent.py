@@ -0,0 +1,47 @@
+"""Tests for per-question tool subsets in agent.langchain_agent."""
+
+import pytest
+
+from agent.langchain_agent import LangChainAgent
+from tools.langchain_tools import LANGCHAIN_TOOLS
+
+STEP = "Thought: add\nAction: calculator\nAction Input: 2+2\nObservation: 4"
+
+
+@pytest.fixture
+def agent():
+    return LangChainAgent("test-key", verbose=False)
+
+
+def feed(handler, text):
+    """Stream text line by line and return the first cut."""
+    streamed = ""
+    for line in text.splitlines(keepends=True):
+        streamed += line
+        cut = handler(streamed)
+        if cut is not None:
+            return cut
+    return None
+
+
+def test_steps_are_checked_against_the_offered_tools(agent):
+    executor = agent._executor_for([tool for tool in LANGCHAIN_TOOLS if tool.name == "web_search"])
+    with agent._offering(executor):
+        assert feed(agent.llm.chunk_handler_factory(), STEP) is None
+        assert agent.llm.output_validator(STEP.rpartition("\nObservation")[0]) == "parse_error"
+    assert agent._get_dispatch_stats()["early_actions"] == 0
+
+
+def test_all_tools_are_offered_outside_a_subset(agent):
+    with agent._offering(agent.agent_executor):
+        assert feed(agent.llm.chunk_handler_factory(), STEP) == STEP.index("\nObservation")
+        assert agent.llm.output_validator(STEP.rpartition("\nObservation")[0]) is None
+    assert agent._get_dispatch_stats()["early_actions"] == 1
+
+
+def test_executor_parsers_share_counters(agent):
+    executor = agent._executor_for([tool for tool in LANGCHAIN_TOOLS if tool.name != "wikipedia"])
+    parser = agent._parsers[frozenset(tool.name for tool in executor.tools)]
+    assert "wikipedia" not in parser.tool_names
+    parser.parse("Final Answer: 4")
+    assert agent.output_parser.get_stats()["clean"] == 1
@@ -0,0 +1,110 @@
+"""Tests for agent.long_term_memory."""
+
+import numpy as np
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agent.long_term_memory import INITIAL_CAPACITY, ExchangeIndex, LongTermMemory
+
+
+def unit(dim, position):
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[position] = 1.0
+    return vector
+
+
+class TestExchangeIndex:
+
+    def test_grows_past_its_initial_capacity(self):
+        index = ExchangeIndex(dim=8, capacity=2)
+        for i in range(5):
+            index.add(unit(8, i), f"q{i}", f"a{i}")
+        assert len(index) == 5
+        assert index._vectors.shape == (8, 8)
+        assert [index.exchange(i) for i in (0, 4)] == [("q0", "a0"), ("q4", "a4")]
+        # Rows copied on growth are still found
+        assert index.search(unit(8, 1), top_k=1, limit=5, min_score=0.5) == [1]
+
+    def test_default_capacity_doubles(self):
+        index = ExchangeIndex(dim=4)
+        for i in range(INITIAL_CAPACITY + 1):
+            index.add(unit(4, i % 4), "q", "a")
+        assert len(index._vectors) == 2 * INITIAL_CAPACITY
+
+    def test_search_top_k_limit_and_min_score(self):
+        index = ExchangeIndex(dim=8)
+        for i, position in enumerate([0, 1, 0, 2, 0]):
+            index.add(unit(8, position), f"q{i}", f"a{i}")
+        query = unit(8, 0)
+        # Matches come back in conversation order, at most top_k of them
+        assert index.search(query, top_k=3, limit=5, min_score=0.5) == [0, 2, 4]
+        assert len(index.search(query, top_k=2, limit=5, min_score=0.5)) == 2
+        # Exchanges at or past limit are not considered
+        assert index.search(query, top_k=3, limit=3, min_score=0.5) == [0, 2]
+        # Dissimilar exchanges are dropped even when top_k leaves room
+        assert index.search(unit(8, 2), top_k=3, limit=5, min_score=0.5) == [3]
+        assert index.search(query, top_k=0, limit=5, min_score=0.5) == []
+        assert ExchangeIndex(dim=8).search(query, top_k=3, limit=5, min_score=0.5) == []
+
+
+def make_memory(**kwargs):
+    return LongTermMemory(memory_key="chat_history", return_messages=True, output_key="output", **kwargs)
+
+
+def save(memory, question, answer):
+    memory.save_context({"input": question}, {"output": answer})
+
+
+def contents(messages):
+    return [message.content for message in messages]
+
+
+@pytest.fixture
+def memory():
+    memory = make_memory(recent_k=2, recall_k=1)
+    save(memory, "What is the capital of France?", "Paris is the capital of France.")
+    save(memory, "How tall is Mount Everest?", "Mount Everest is 8849 metres tall.")
+    save(memory, "Who wrote Hamlet?", "William Shakespeare wrote Hamlet.")
+    save(memory, "What is 2 + 2?", "4")
+    return memory
+
+
+def test_recall_puts_relevant_older_exchanges_before_the_recent_ones(memory):
+    messages = memory.recall("What river flows through the capital of France?")
+    assert contents(messages) == [
+        "What is the capital of France?", "Paris is the capital of France.",
+        "Who wrote Hamlet?", "William Shakespeare wrote Hamlet.",
+        "What is 2 + 2?", "4",
+    ]
+    assert [type(message) for message in messages[:2]] == [HumanMessage, AIMessage]
+    assert memory.get_stats()["recalled"] == 1
+
+
+def test_unrelated_questions_get_only_the_recent_exchanges(memory):
+    history = memory.load_memory_variables({"input": "Any good pizza recipes?"})["chat_history"]
+    assert contents(history) == ["Who wrote Hamlet?", "William Shakespeare wrote Hamlet.", "What is 2 + 2?", "4"]
+    # The full conversation is still kept for display
+    assert len(memory.chat_memory.messages) == 8
+
+
+def test_sessions_are_kept_apart(memory):
+    memory.session_id = "other"
+    assert memory.recall("What is the capital of France?") == []
+    save(memory, "Capital of Spain?", "Madrid.")
+    assert contents(memory.recall("capital")) == ["Capital of Spain?", "Madrid."]
+
+    memory.session_id = "default"
+    assert memory.get_stats()["session_exchanges"] == 4
+
+
+def test_clear_forgets_only_the_current_session(memory):
+    memory.session_id = "other"
+    save(memory, "Capital of Spain?", "Madrid.")
+    memory.session_id = "default"
+    memory.clear()
+    assert memory.recall("What is the capital of France?") == []
+    assert memory.chat_memory.messages == []
+    assert memory.get_stats()["session_exchanges"] == 0
+
+    memory.session_id = "other"
+    assert contents(memory.recall("capital")) == ["Capital of Spain?", "Madrid."]
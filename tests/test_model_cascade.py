@@ -0,0 +1,76 @@
+"""Tests for llm.model_cascade."""
+
+import pytest
+
+from llm.model_cascade import ModelCascade
+
+TIERS = {"routing": ["fast", "strong"], "final_answer": ["strong"]}
+
+
+@pytest.fixture
+def cascade():
+    return ModelCascade(stage_models=TIERS, default_model="strong")
+
+
+def test_accepted_first_tier_is_returned(cascade):
+    calls = []
+
+    def call(model_name):
+        calls.append(model_name)
+        return f"{model_name} answer"
+
+    assert cascade.run("routing", call, lambda response: None) == "fast answer"
+    assert calls == ["fast"]
+    assert cascade.get_stats()["stages"]["routing"] == {"calls": 1, "escalated": 0, "escalation_rate": 0.0}
+
+
+def test_rejected_output_escalates_to_the_next_tier(cascade):
+    checked = []
+
+    def accept(response):
+        checked.append(response)
+        return "parse_error"
+
+    assert cascade.run("routing", lambda model_name: model_name, accept) == "strong"
+    # The last tier is never judged, its answer is always returned
+    assert checked == ["fast"]
+    stats = cascade.get_stats()
+    assert stats["escalation_reasons"] == {"routing:parse_error": 1}
+    assert stats["stages"]["routing"]["escalation_rate"] == 1.0
+
+
+def test_errors_escalate_and_the_last_tier_error_is_raised(cascade):
+    def flaky(model_name):
+        if model_name == "fast":
+            raise RuntimeError("overloaded")
+        return "strong answer"
+
+    assert cascade.run("routing", flaky, lambda response: None) == "strong answer"
+
+    def broken(model_name):
+        raise RuntimeError(f"{model_name} down")
+
+    with pytest.raises(RuntimeError, match="strong down"):
+        cascade.run("routing", broken, lambda response: None)
+
+    stats = cascade.get_stats()
+    assert stats["escalation_reasons"] == {"routing:error": 2}
+    assert stats["tiers"]["fast"]["errors"] == 2
+    assert stats["tiers"]["strong"]["errors"] == 1
+    assert stats["tiers"]["strong"]["calls"] == 2
+    assert stats["stages"]["routing"] == {"calls": 2, "escalated": 2, "escalation_rate": 1.0}
+
+
+def test_pace_runs_before_every_attempt(cascade):
+    paced = []
+    cascade.run("routing", lambda model_name: model_name, lambda response: "schema", pace=lambda: paced.append(1))
+    assert len(paced) == 2
+
+
+def test_stages_and_methods_resolve_to_tiers(cascade):
+    assert cascade.resolve_stage("text_to_text") == "final_answer"
+    assert cascade.resolve_stage("text_to_json") == "routing"
+    assert cascade.resolve_stage("text_to_text", "summarization") == "summarization"
+    assert cascade.models_for("final_answer") == ["strong"]
+    # Stages without tiers use the default model
+    assert cascade.models_for("summarization") == ["strong"]
@@ -0,0 +1,214 @@
+"""Tests for agent.output_parser."""
+
+import pytest
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.exceptions import OutputParserException
+
+from agent.output_parser import IncrementalReActParser, RobustReActOutputParser
+
+TOOLS = ["web_search", "calculator", "get_datetime", "wikipedia", "Python_REPL"]
+
+
+@pytest.fixture
+def parser():
+    return RobustReActOutputParser(tool_names=TOOLS, no_input_tools=["get_datetime"])
+
+
+def parse(parser, text):
+    """Parse text and return the step with the recovery rule used."""
+    return parser._parse(text)
+
+
+def assert_action(step, tool, tool_input):
+    assert isinstance(step, AgentAction)
+    assert (step.tool, step.tool_input) == (tool, tool_input)
+
+
+def test_clean_action_and_answer(parser):
+    step, recovery = parse(parser, "Thought: look it up\nAction: web_search\nAction Input: bitcoin price")
+    assert_action(step, "web_search", "bitcoin price")
+    assert recovery is None
+
+    step, recovery = parse(parser, "Thought: I know this\nFinal Answer: Paris")
+    assert step.return_values == {"output": "Paris"}
+    assert recovery is None
+
+
+def test_fences_and_bold_keywords_are_stripped(parser):
+    step, recovery = parse(parser, "```\nAction: calculator\nAction Input: 2+2\n```")
+    assert_action(step, "calculator", "2+2")
+    assert recovery == "fences"
+
+    step, _ = parse(parser, "**Action:** wikipedia\n**Action Input:** Alan Turing")
+    assert_action(step, "wikipedia", "Alan Turing")
+
+
+def test_answer_before_action_wins(parser):
+    step, recovery = parse(parser, "Final Answer: 4\nAction: calculator\nAction Input: 2+2")
+    assert step.return_values == {"output": "4"}
+    assert recovery == "answer_before_action"
+
+
+def test_answer_after_hallucinated_observation_wins(parser):
+    text = "Action: calculator\nAction Input: 2+2\nObservation: 4\nThought: done\nFinal Answer: 4"
+    step, recovery = parse(parser, text)
+    assert step.return_values == {"output": "4"}
+    assert recovery == "hallucinated_observation"
+
+
+def test_action_wins_over_answer_without_observation(parser):
+    step, recovery = parse(parser, "Action: calculator\nAction Input: 2+2\nFinal Answer: 4")
+    assert_action(step, "calculator", "2+2")
+    assert recovery == "action_and_answer"
+
+
+def test_incomplete_action_falls_back_to_answer(parser):
+    step, recovery = parse(parser, "Action: web_search\nFinal Answer: Paris")
+    assert step.return_values == {"output": "Paris"}
+    assert recovery == "incomplete_action"
+
+
+def test_only_first_of_several_actions_is_taken(parser):
+    text = "Action: wikipedia\nAction Input: Paris\nAction: web_search\nAction Input: Paris weather"
+    step, recovery = parse(parser, text)
+    assert_action(step, "wikipedia", "Paris")
+    assert recovery == "multiple_actions"
+
+
+def test_missing_action_input_is_recovered(parser):
+    step, recovery = parse(parser, 'Action: wikipedia("Alan Turing")')
+    assert_action(step, "wikipedia", "Alan Turing")
+    assert recovery == "inline_action_input"
+
+    step, recovery = parse(parser, "Action: web_search\nbitcoin price today")
+    assert_action(step, "web_search", "bitcoin price today")
+    assert recovery == "missing_action_input"
+
+
+def test_empty_input_only_for_tools_that_need_none(parser):
+    for text in ("Action: web_search\n", "Action: web_search\nAction Input: \n"):
+        with pytest.raises(OutputParserException) as info:
+            parse(parser, text)
+        assert "Missing 'Action Input:'" in info.value.observation
+
+    step, _ = parse(parser, "Action: get_datetime\n")
+    assert_action(step, "get_datetime", "")
+
+
+def test_tool_names_match_case_insensitively(parser):
+    step, recovery = parse(parser, "Action: Web Search\nAction Input: news")
+    assert_action(step, "web_search", "news")
+    assert recovery == "tool_name"
+
+
+def test_bare_text_is_the_answer(parser):
+    step, recovery = parse(parser, "The capital of France is Paris.")
+    assert step.return_values == {"output": "The capital of France is Paris."}
+    assert recovery == "bare_answer"
+
+    step, _ = parse(parser, "Do I need to use a tool? No. Paris is the capital.")
+    assert step.return_values == {"output": "Paris is the capital."}
+
+
+@pytest.mark.parametrize("text", [
+    "Thought: I should search for this",
+    "Do I need to use a tool? Yes",
+    "Do I need to use a tool? No",
+    "Error in text_to_text: 429 quota exceeded",
+    "Error in text_to_text: timeout\nFinal Answer: sorry",
+])
+def test_reasoning_and_failed_calls_are_never_answers(parser, text):
+    with pytest.raises(OutputParserException) as info:
+        parse(parser, text)
+    assert info.value.send_to_llm
+
+
+def test_parse_counts_clean_recovered_and_failed(parser):
+    parser.parse("Final Answer: 4")
+    parser.parse("Action: web_search\nnews")
+    with pytest.raises(OutputParserException):
+        parser.parse("Thought: hmm")
+    assert parser.get_stats() == {
+        "parsed": 2, "clean": 1, "recovered:missing_action_input": 1, "failed": 1
+    }
+    assert parser.can_parse("Final Answer: 4")
+    assert parser.get_stats()["parsed"] == 2
+
+
+def test_escalation_reason(parser):
+    assert parser.escalation_reason("Action: web_search\nAction Input: news") is None
+    assert parser.escalation_reason("Thought: I know this\nFinal Answer: Paris") is None
+    assert parser.escalation_reason("Thought: hmm") == "parse_error"
+    assert parser.escalation_reason("Just an answer") == "parse_error"
+    assert parser.escalation_reason("Action: web_search\nFinal Answer: Paris") == "parse_error"
+    hallucinated = "Action: calculator\nAction Input: 2+2\nObservation: 4\nFinal Answer: 4"
+    assert parser.escalation_reason(hallucinated) == "low_confidence"
+
+    parser.escalate_answers = True
+    assert parser.escalation_reason("Final Answer: Paris") == "final_answer"
+
+
+def test_parser_for_a_tool_subset(parser):
+    offered = parser.for_tools(["web_search", "get_datetime"])
+    assert offered.tool_names == ["web_search", "get_datetime"]
+    assert offered.no_input_tools == ["get_datetime"]
+    # Tools outside the subset are not matched, and the fast model's call to one is escalated
+    step, recovery = parse(offered, "Action: Wikipedia\nAction Input: Paris")
+    assert_action(step, "Wikipedia", "Paris")
+    assert recovery is None
+    assert offered.escalation_reason("Action: wikipedia\nAction Input: Paris") == "parse_error"
+    assert offered.escalation_reason("Action: web_search\nAction Input: Paris") is None
+    # Counters are shared with the full parser
+    offered.parse("Final Answer: 4")
+    assert parser.get_stats()["clean"] == 1
+
+
+class TestIncrementalParser:
+
+    def feed_all(self, incremental, chunks):
+        """Feed growing text chunk by chunk and return the first cut."""
+        text = ""
+        for chunk in chunks:
+            text += chunk
+            cut = incremental.feed(text)
+            if cut is not None:
+                return text, cut
+        return text, None
+
+    def test_cuts_once_the_action_input_line_ends(self, parser):
+        dispatched = []
+        incremental = IncrementalReActParser(parser, on_action=dispatched.append)
+        text, cut = self.feed_all(incremental, [
+            "Thought: search\nAction: web_", "search\nAction Input: bitcoin",
+            " price", "\nObservation: made up",
+        ])
+        assert text[:cut] == "Thought: search\nAction: web_search\nAction Input: bitcoin price"
+        assert_action(incremental.action, "web_search", "bitcoin price")
+        assert dispatched == [incremental.action]
+        # Later chunks of the same attempt are not inspected again
+        assert incremental.feed(text + "\nmore") is None
+        assert len(dispatched) == 1
+
+    def test_no_cut_for_answers_multiline_tools_or_unknown_tools(self, parser):
+        for chunks in (
+            ["Thought: known\nFinal Answer: Paris\n", "Action: web_search\nAction Input: x\n"],
+            ["Action: Python_REPL\nAction Input: print(1)\n", "print(2)\n"],
+            ["Action: search_engine\nAction Input: news\n", "Observation: x"],
+            ["Action: web_search\nAction Input:\n", "news\n"],
+        ):
+            incremental = IncrementalReActParser(parser)
+            assert self.feed_all(incremental, chunks)[1] is None
+            assert incremental.action is None
+
+    def test_starts_over_on_the_next_models_attempt(self, parser):
+        incremental = IncrementalReActParser(parser)
+        assert self.feed_all(incremental, ["Final Answer: ", "Paris\n"])[1] is None
+        # An escalated model streams from scratch
+        text, cut = self.feed_all(incremental, ["Action: wikipedia\n", "Action Input: Paris\n"])
+        assert text[:cut] == "Action: wikipedia\nAction Input: Paris"
+
+    def test_no_cut_for_tools_outside_the_offered_subset(self, parser):
+        dispatched = []
+        incremental = IncrementalReActParser(parser.for_tools(["web_search"]), on_action=dispatched.append)
+        assert self.feed_all(incremental, ["Action: wikipedia\n", "Action Input: Paris\n"])[1] is None
+        assert dispatched == []
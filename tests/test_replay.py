@@ -0,0 +1,67 @@
+"""Record a session with a fake Gemini model, then replay it from the cassette."""
+
+import pytest
+
+import llm.custom_gemini as custom_gemini
+from agent.langchain_agent import LangChainAgent
+from replay import load_sessions, load_settings, replay_session
+from utils.cassette import Cassette
+
+
+class FakeResponse:
+    """Minimal generate_content response or stream chunk."""
+
+    def __init__(self, text):
+        self.text = text
+        self.candidates = [type("Candidate", (), {"finish_reason": "STOP", "avg_logprobs": None})()]
+        self.usage_metadata = type("Usage", (), {"prompt_token_count": 10, "candidates_token_count": 5})()
+
+
+class FakeModel:
+    """Answers every prompt directly, echoing the conversation length it was sent."""
+
+    calls = 0
+
+    def generate_content(self, prompt, stream=False, **options):
+        FakeModel.calls += 1
+        answer = FakeResponse(f"Final Answer: prompt of {len(prompt)} chars")
+        return [answer] if stream else answer
+
+
+class OfflineModel:
+    """Fails any call that was expected to come from the cassette."""
+
+    def generate_content(self, prompt, stream=False, **options):
+        raise AssertionError("replay reached the model")
+
+
+@pytest.fixture(autouse=True)
+def no_pacing(monkeypatch):
+    monkeypatch.setattr(custom_gemini, "RATE_LIMIT_INTERVAL_S", 0.0)
+
+
+def test_recorded_session_replays_with_its_settings(monkeypatch, tmp_path):
+    path = str(tmp_path / "session.jsonl.gz")
+    questions = ["What is the capital of France?", "And its population?", "Which river runs through it?"]
+    settings = {"request_deadline_s": 30.0, "token_budget": 50000, "tool_top_k": None, "long_term_memory": True}
+
+    monkeypatch.setattr(custom_gemini.CustomGeminiLLM, "_get_model", lambda self, name: FakeModel())
+    recorder = Cassette(path, mode="record")
+    agent = LangChainAgent("test-key", cassette=recorder, verbose=False, **settings)
+    recorded = [agent.answer_question(question) for question in questions]
+    recorder.close()
+    assert FakeModel.calls >= len(questions)
+
+    monkeypatch.setattr(custom_gemini.CustomGeminiLLM, "_get_model", lambda self, name: OfflineModel())
+    cassette = Cassette(path, mode="replay", latency_scale=0)
+    sessions = load_sessions(cassette)
+    assert list(sessions.values()) == [questions]
+    session = next(iter(sessions))
+    assert load_settings(cassette)[session] == settings
+
+    latencies = replay_session("test-key", cassette, questions, load_settings(cassette)[session])
+    assert len(latencies) == len(questions)
+    stats = cassette.get_stats()
+    assert stats["misses"] == 0
+    assert stats["replayed"] == FakeModel.calls
+    assert all(answer.startswith("prompt of") for answer in recorded)
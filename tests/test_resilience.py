@@ -0,0 +1,151 @@
+"""Tests for tools.resilience."""
+
+import threading
+import time
+
+from langchain_core.tools import BaseTool
+
+from tools import resilience
+from tools.langchain_tools import _call_tool, tool_flight
+from tools.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, ResilientTool
+from utils.deadline import Deadline
+
+
+class SlowTool(BaseTool):
+    """Test tool that sleeps before answering."""
+
+    name: str = "slow"
+    description: str = "test tool"
+    delay: float = 0.0
+
+    def _run(self, query: str, run_manager=None) -> str:
+        time.sleep(self.delay)
+        return f"done: {query}"
+
+
+def test_breaker_opens_after_threshold_and_probes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    # Only one probe at a time
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_breaker_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.get_stats()["opened"] == 2
+
+
+def test_timeout_counts_as_failure():
+    tool = ResilientTool.wrap(SlowTool(delay=0.3), timeout=0.05)
+    result, error = tool.call_protected(lambda: tool.inner._run("q"))
+    assert result is None
+    assert error == "timed out after 0.05s"
+    assert tool.breaker.get_stats()["failures"] == 1
+
+
+def test_timeout_starts_when_a_worker_picks_up_the_call(monkeypatch):
+    pool = resilience.ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(resilience, "_executor", pool)
+    release = threading.Event()
+    pool.submit(release.wait, 5)
+    tool = ResilientTool.wrap(SlowTool(delay=0.1), timeout=0.5)
+
+    threading.Timer(0.3, release.set).start()
+    result, error = tool.call_protected(lambda: tool.inner._run("q"))
+
+    # 0.3s queued plus 0.1s running would have overrun a timer started at submission
+    assert (result, error) == ("done: q", None)
+    pool.shutdown()
+
+
+def test_saturated_pool_does_not_open_the_breaker(monkeypatch):
+    pool = resilience.ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(resilience, "_executor", pool)
+    release = threading.Event()
+    pool.submit(release.wait, 5)
+    tool = ResilientTool.wrap(SlowTool(), timeout=0.05)
+
+    for _ in range(5):
+        result, error = tool.call_protected(lambda: tool.inner._run("q"))
+        assert error == "no worker was free before the deadline"
+
+    assert tool.breaker.state == CLOSED
+    assert tool.get_stats()["busy"] == 5
+    release.set()
+    pool.shutdown()
+
+
+def test_request_deadline_cut_does_not_count_as_failure():
+    tool = ResilientTool.wrap(SlowTool(delay=0.3), timeout=5.0)
+    with Deadline(0.05).activate():
+        result, error = tool.call_protected(lambda: tool.inner._run("q"))
+    assert error.startswith("request deadline reached")
+    assert tool.breaker.get_stats()["failures"] == 0
+
+
+def test_python_repl_runaway_code_is_killed():
+    from tools.langchain_tools import PythonTool
+
+    tool = ResilientTool.wrap(PythonTool())
+    start = time.monotonic()
+    with Deadline(1.0).activate():
+        output = tool._run("while True: pass")
+    assert time.monotonic() - start < 3.0
+    assert "timed out" in output.lower()
+    with Deadline(5.0).activate():
+        assert tool._run("print(6 * 7)").strip() == "42"
+
+
+def test_prefetch_is_bounded_by_the_tool_timeout():
+    tool = ResilientTool.wrap(SlowTool(delay=0.3), timeout=0.05)
+    result, error = tool.prefetch("q").result(timeout=1.0)
+    assert result is None
+    assert error == "timed out after 0.05s"
+    # The agent's own call records the outcome
+    assert tool.breaker.get_stats()["failures"] == 0
+
+
+class FailingSearch(BaseTool):
+    """Shared search tool whose requests fail after a delay."""
+
+    name: str = "failing_search"
+    description: str = "test tool"
+
+    def _run(self, query: str, run_manager=None) -> str:
+        def search():
+            time.sleep(0.2)
+            return "Search failed: service unavailable"
+        return _call_tool("failing_search", (query,), search)
+
+
+def test_prefetched_failure_counts_once_against_the_breaker():
+    tool = ResilientTool.wrap(FailingSearch(), timeout=1.0)
+    prefetch = tool.prefetch("bitcoin price")
+    time.sleep(0.05)
+    # The agent's call joins the prefetched request in flight
+    assert tool._run("bitcoin price").startswith("failing_search is unavailable")
+    prefetch.result(timeout=1.0)
+    assert tool.breaker.get_stats()["failures"] == 1
+    assert tool_flight.get_stats()["coalesced"] >= 1
+
+
+def test_prefetch_respects_request_deadline():
+    tool = ResilientTool.wrap(SlowTool(delay=0.0), timeout=1.0)
+    with Deadline(0.0).activate():
+        future = tool.prefetch("q")
+    assert future.result(timeout=1.0) == (None, "request deadline exceeded")
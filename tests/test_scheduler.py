@@ -0,0 +1,84 @@
+"""Tests for llm.scheduler."""
+
+import threading
+import time
+
+import pytest
+
+from llm.scheduler import BATCH, INTERACTIVE, LLMScheduler, SchedulerRejected
+from utils.deadline import Deadline
+
+
+def wait_until_queued(scheduler, count):
+    """Wait until count calls are queued across all classes."""
+    for _ in range(200):
+        if sum(stats["queued"] for stats in scheduler.get_stats().values()) == count:
+            return
+        time.sleep(0.005)
+    raise AssertionError(f"expected {count} queued calls")
+
+
+def test_interactive_call_is_served_before_a_queued_batch_burst():
+    scheduler = LLMScheduler(capacity=1)
+    order = []
+
+    def call(priority_class, session, label):
+        with scheduler.slot(priority_class, session):
+            order.append(label)
+
+    threads = []
+    with scheduler.slot(INTERACTIVE, "holder"):
+        for index, (priority_class, session, label) in enumerate([
+            (BATCH, "job", "batch-1"),
+            (BATCH, "job", "batch-2"),
+            (INTERACTIVE, "user", "interactive"),
+        ]):
+            thread = threading.Thread(target=call, args=(priority_class, session, label))
+            thread.start()
+            threads.append(thread)
+            wait_until_queued(scheduler, index + 1)
+    for thread in threads:
+        thread.join(timeout=2.0)
+    assert order == ["interactive", "batch-1", "batch-2"]
+
+
+def test_call_that_cannot_be_served_in_time_is_rejected():
+    scheduler = LLMScheduler(capacity=1)
+    # Pretend each call holds its slot for a second
+    scheduler._service_s = 1.0
+    with scheduler.slot(INTERACTIVE, "holder"):
+        with pytest.raises(SchedulerRejected):
+            with scheduler.slot(INTERACTIVE, "user", Deadline(0.5)):
+                pass
+    assert scheduler.get_stats()[INTERACTIVE]["rejected"] == 1
+
+
+def test_deadline_passing_in_queue_times_out():
+    scheduler = LLMScheduler(capacity=1)
+    with scheduler.slot(INTERACTIVE, "holder"):
+        with pytest.raises(Exception, match="while queued"):
+            with scheduler.slot(INTERACTIVE, "user", Deadline(0.05)):
+                pass
+    stats = scheduler.get_stats()[INTERACTIVE]
+    assert stats["timed_out"] == 1
+    assert stats["queued"] == 0
+
+
+def test_interrupted_wait_does_not_block_later_calls(monkeypatch):
+    scheduler = LLMScheduler(capacity=1)
+
+    def interrupted_wait(timeout=None):
+        raise KeyboardInterrupt
+
+    with scheduler.slot(INTERACTIVE, "holder"):
+        monkeypatch.setattr(scheduler._cond, "wait", interrupted_wait)
+        with pytest.raises(KeyboardInterrupt):
+            with scheduler.slot(INTERACTIVE, "user"):
+                pass
+        monkeypatch.undo()
+
+    with scheduler.slot(INTERACTIVE, "next", Deadline(1.0)):
+        pass
+    stats = scheduler.get_stats()[INTERACTIVE]
+    assert stats["queued"] == 0
+    assert stats["timed_out"] == 0
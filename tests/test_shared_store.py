@@ -0,0 +1,107 @@
+"""Tests for utils.shared_store."""
+
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from utils.shared_store import MemoryStore, ResponseCache, SharedStore, SQLiteStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStore()
+    return SQLiteStore(str(tmp_path / "shared.db"))
+
+
+def test_shared_store_is_abstract():
+    with pytest.raises(TypeError):
+        SharedStore()
+
+
+def test_values_expire_after_ttl(store):
+    store.set("k", {"answer": [1, 2]}, ttl=0.05)
+    assert store.get("k") == {"answer": [1, 2]}
+    time.sleep(0.06)
+    assert store.get("k") is None
+    assert store.get("missing") is None
+
+
+def test_reserve_slot_spaces_calls_and_respects_max_wait(store):
+    first = store.reserve_slot("api", interval=10.0)
+    assert first == pytest.approx(time.time(), abs=0.5)
+    # The next slot is 10s away, so a 1s wait is refused and nothing is reserved
+    assert store.reserve_slot("api", interval=10.0, max_wait=1.0) is None
+    assert store.reserve_slot("api", interval=10.0) == pytest.approx(first + 10.0)
+    # Separate limits do not share a schedule
+    assert store.reserve_slot("other", interval=10.0) == pytest.approx(time.time(), abs=0.5)
+
+
+def test_push_back_only_moves_the_slot_later(store):
+    now = time.time()
+    store.push_back("api", now + 30.0)
+    store.push_back("api", now + 5.0)
+    assert store.reserve_slot("api", interval=1.0) == pytest.approx(now + 30.0)
+
+
+def test_concurrent_reservations_get_distinct_slots(store):
+    slots = []
+    lock = threading.Lock()
+
+    def reserve():
+        slot = store.reserve_slot("api", interval=1.0)
+        with lock:
+            slots.append(slot)
+
+    threads = [threading.Thread(target=reserve) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    slots.sort()
+    assert all(b - a == pytest.approx(1.0) for a, b in zip(slots, slots[1:]))
+
+
+def test_response_cache_stores_only_cacheable_values():
+    cache = ResponseCache("test", ttl=60, store=MemoryStore())
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "Error in text_to_text: boom" if len(calls) == 1 else "ok"
+
+    is_ok = lambda value: not value.startswith("Error")
+    assert cache.get_or_compute(["q"], compute, cacheable=is_ok).startswith("Error")
+    assert cache.get_or_compute(["q"], compute, cacheable=is_ok) == "ok"
+    assert cache.get_or_compute(["q"], compute, cacheable=is_ok) == "ok"
+    assert len(calls) == 2
+    assert cache.get_stats() == {"hits": 1, "misses": 2}
+
+
+def reserve_in_process(path, count, queue):
+    """Reserve slots from a separate process with its own store connection."""
+    store = SQLiteStore(path)
+    slots = [store.reserve_slot("api", interval=0.5) for _ in range(count)]
+    queue.put((slots, store.get("greeting")))
+
+
+def test_processes_sharing_a_sqlite_file_get_distinct_slots(tmp_path):
+    path = str(tmp_path / "shared.db")
+    SQLiteStore(path).set("greeting", "hello", ttl=60)
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    processes = [context.Process(target=reserve_in_process, args=(path, 5, queue)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    results = [queue.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join(timeout=30)
+        assert process.exitcode == 0
+
+    slots = sorted(slot for process_slots, _ in results for slot in process_slots)
+    assert len(slots) == 20
+    assert all(b - a == pytest.approx(0.5) for a, b in zip(slots, slots[1:]))
+    # Values written by one process are visible to the others
+    assert [greeting for _, greeting in results] == ["hello"] * 4
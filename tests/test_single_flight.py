@@ -0,0 +1,147 @@
+"""Tests for utils.single_flight."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.single_flight import SingleFlight
+
+
+def test_do_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    executions = []
+
+    def fn():
+        executions.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", fn)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("key", fn))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert results == ["result"] * 4
+    assert len(executions) == 1
+    assert flight.get_stats() == {"calls": 4, "executions": 1, "coalesced": 3}
+
+
+def test_do_shares_the_leaders_exception():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fn():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("key", fn)
+        except ValueError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert errors == ["boom", "boom"]
+
+
+def test_do_follower_timeout():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fn():
+        started.set()
+        release.wait(5)
+
+    leader = threading.Thread(target=lambda: flight.do("key", fn))
+    leader.start()
+    started.wait(5)
+    with pytest.raises(TimeoutError):
+        flight.do("key", fn, timeout=0.01)
+    release.set()
+    leader.join(5)
+
+
+def test_do_runs_again_after_completion():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    assert flight.get_stats()["executions"] == 2
+
+
+def test_do_async_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    executions = []
+
+    async def fn():
+        executions.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async("key", fn) for _ in range(4)))
+
+    assert asyncio.run(main()) == ["result"] * 4
+    assert len(executions) == 1
+    assert flight.get_stats() == {"calls": 4, "executions": 1, "coalesced": 3}
+
+
+def test_do_async_leader_cancellation_does_not_cancel_followers():
+    flight = SingleFlight()
+
+    async def fn():
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do_async("key", fn))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do_async("key", fn))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == "result"
+
+
+def test_do_async_shares_the_exception():
+    flight = SingleFlight()
+
+    async def fn():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(
+            flight.do_async("key", fn), flight.do_async("key", fn), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+    assert [type(r) for r in results] == [ValueError, ValueError]
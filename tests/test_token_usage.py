@@ -0,0 +1,132 @@
+"""Tests for llm.token_usage and the agent's token budget enforcement."""
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import llm.custom_gemini as custom_gemini
+from agent.langchain_agent import LangChainAgent
+from llm.token_usage import TokenLedger, estimate_tokens, split_prompt_sections, token_ledger, usage_scope
+from prompts.agent_prompts import REACT_AGENT_PROMPT
+
+
+def react_prompt(history="", question="What is 2+2?", scratchpad=""):
+    """Render the agent's ReAct prompt."""
+    return REACT_AGENT_PROMPT.format(
+        chat_history=history, tools="calculator: math", tool_names="calculator",
+        input=question, agent_scratchpad=scratchpad
+    )
+
+
+def test_split_prompt_sections_measures_each_section():
+    prompt = react_prompt(history="Human: hi\nAI: hello", scratchpad="Action: calculator")
+    sections = split_prompt_sections(prompt)
+    assert set(sections) == {"other", "history", "tools", "instructions", "question", "scratchpad"}
+    assert sum(sections.values()) == len(prompt)
+    assert sections["scratchpad"] >= len("Action: calculator")
+
+    longer = split_prompt_sections(react_prompt(history="Human: hi\nAI: hello" * 10))
+    assert longer["history"] > sections["history"]
+    assert split_prompt_sections("no markers here") == {"other": len("no markers here")}
+
+
+def test_ledger_groups_usage_and_splits_input_by_section():
+    ledger = TokenLedger()
+    prompt = react_prompt(history="x" * 4000)
+    with usage_scope("a") as usage:
+        ledger.record("text_to_text", "fast", "routing", prompt, 100, 10)
+        usage.iteration = 1
+        ledger.record("text_to_text", "strong", "final_answer", prompt, 200, 20)
+    with usage_scope("b"):
+        ledger.record("text_to_json", "fast", "routing", "plain", 50, 5)
+
+    by_method = {row["method"]: row for row in ledger.query(group_by=("method",))}
+    assert by_method["text_to_text"]["calls"] == 2
+    assert by_method["text_to_text"]["input_tokens"] == 300
+    assert by_method["text_to_json"]["sections"] == {"other": 50}
+
+    rows = ledger.query(session_id="a", group_by=("iteration", "model"))
+    assert sorted((row["iteration"], row["model"], row["output_tokens"]) for row in rows) == [
+        (0, "fast", 10), (1, "strong", 20)
+    ]
+    sections = rows[0]["sections"]
+    assert sections["history"] == max(sections.values())
+    assert abs(sum(sections.values()) - rows[0]["input_tokens"]) <= len(sections)
+
+    with pytest.raises(ValueError):
+        ledger.query(group_by=("user",))
+
+
+def test_budgets_and_clear_session():
+    ledger = TokenLedger()
+    ledger.set_budget("a", 100)
+    assert ledger.remaining_budget("a") == 100
+    assert ledger.remaining_budget("b") is None
+    with usage_scope("a"):
+        ledger.record("text_to_text", "fast", "routing", "p", 60, 10)
+    with usage_scope("b"):
+        ledger.record("text_to_text", "fast", "routing", "p", 1, 1)
+    assert ledger.remaining_budget("a") == 30
+
+    ledger.clear_session("a")
+    assert ledger.session_usage("a")["total_tokens"] == 0
+    assert ledger.remaining_budget("a") is None
+    assert ledger.query(session_id="a") == []
+    assert ledger.session_usage("b")["total_tokens"] == 2
+
+
+class FakeResponse:
+    """Non-streamed answer reporting a fixed token usage."""
+
+    text = "Final Answer: 4"
+
+    def __init__(self):
+        self.candidates = [type("Candidate", (), {"finish_reason": "STOP", "avg_logprobs": None})()]
+        self.usage_metadata = type("Usage", (), {"prompt_token_count": 300, "candidates_token_count": 20})()
+
+
+class FakeModel:
+
+    def generate_content(self, prompt, stream=False, **options):
+        return [FakeResponse()] if stream else FakeResponse()
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    monkeypatch.setattr(custom_gemini, "RATE_LIMIT_INTERVAL_S", 0.0)
+    monkeypatch.setattr(custom_gemini.CustomGeminiLLM, "_get_model", lambda self, name: FakeModel())
+    agent = LangChainAgent("test-key", verbose=False, token_budget=500)
+    # Every question is new, so nothing comes from the response cache
+    agent.llm.custom_llm.cache.ttl = 0
+    yield agent
+    token_ledger.clear_session(agent.session_id)
+
+
+def exchange(index, size):
+    return [HumanMessage(content=f"q{index} " + "x" * size), AIMessage(content=f"a{index} " + "y" * size)]
+
+
+def test_trim_history_drops_oldest_exchanges_first(agent):
+    agent.memory.chat_memory.messages = exchange(1, 400) + exchange(2, 400) + exchange(3, 40)
+    cost_of_last = agent.MAX_ITERATIONS * sum(
+        estimate_tokens(m.content) for m in agent.memory.chat_memory.messages[-2:]
+    )
+    agent._trim_history(int((cost_of_last + 10) / 0.5))
+    assert [m.content[:2] for m in agent.memory.chat_memory.messages] == ["q3", "a3"]
+    assert agent.trimmed_messages == 4
+
+    agent._trim_history(10 ** 6)
+    assert agent.trimmed_messages == 4
+
+
+def test_spent_budget_stops_the_conversation_until_a_new_one(agent):
+    assert agent.answer_question("What is 2+2?") == "4"
+    assert agent.get_token_totals()["remaining"] == 500 - 320
+    assert agent.answer_question("And 3+3?") == "4"
+    assert agent.get_token_totals()["remaining"] < 0
+    assert "used up its token budget" in agent.answer_question("And 4+4?")
+
+    old_session = agent.session_id
+    agent.init_conversation()
+    assert token_ledger.session_usage(old_session)["total_tokens"] == 0
+    assert agent.get_token_totals()["remaining"] == 500
+    assert agent.answer_question("What is 5+5?") == "4"
@@ -0,0 +1,44 @@
+"""Tests for agent.tool_selector."""
+
+import pytest
+
+from agent.tool_selector import ToolSelector
+from tools.langchain_tools import LANGCHAIN_TOOLS
+
+
+@pytest.fixture(scope="module")
+def selector():
+    return ToolSelector(LANGCHAIN_TOOLS)
+
+
+def selected(selector, question):
+    return [tool.name for tool in selector.select(question)]
+
+
+@pytest.mark.parametrize("question", [
+    "Who was the president of France in 1995?",
+    "Who won the 2022 World Cup?",
+])
+def test_years_do_not_pull_in_the_calculator(selector, question):
+    names = selected(selector, question)
+    assert "wikipedia" in names
+    assert "calculator" not in names
+
+
+def test_paper_question_with_a_year_gets_arxiv_only(selector):
+    assert selected(selector, "Find recent arxiv papers from 2023 on diffusion models") == ["web_search", "arxiv"]
+
+
+@pytest.mark.parametrize("question", [
+    "What is 15 * 23 + 7?",
+    "What is 15% of 240?",
+    "How much is 3 plus 4?",
+])
+def test_arithmetic_selects_the_calculator(selector, question):
+    assert "calculator" in selected(selector, question)
+
+
+def test_web_search_is_always_offered_in_tool_order(selector):
+    names = selected(selector, "What time is it now?")
+    assert names == ["web_search", "get_datetime"]
+    assert selector.get_stats()["selections"] >= 1
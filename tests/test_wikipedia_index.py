@@ -0,0 +1,57 @@
+"""Tests for tools.wikipedia_index."""
+
+import json
+
+import pytest
+
+from tools.wikipedia_index import WikipediaIndex, extract_summary
+
+
+ARTICLES = [
+    {"title": "Tokyo", "revision": 1, "text": "Tokyo is the capital of Japan and its most populous city."},
+    {"title": "Alan Turing", "revision": 1, "text": "Alan Turing was an English mathematician and computer scientist."},
+]
+
+
+def write_jsonl(path, articles):
+    path.write_text("\n".join(json.dumps(article) for article in articles) + "\n")
+    return str(path)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = WikipediaIndex(str(tmp_path / "wiki.sqlite"))
+    index.ingest(write_jsonl(tmp_path / "dump.jsonl", ARTICLES))
+    return index
+
+
+def test_search_finds_matching_article(index):
+    results = index.search("Turing mathematician")
+    assert [title for title, _ in results] == ["Alan Turing"]
+
+
+def test_exact_title_match(index):
+    assert index.search("tokyo")[0][0] == "Tokyo"
+
+
+def test_unrelated_query_is_a_miss(index):
+    assert index.run("who is the president of France") is None
+    assert index.get_stats()["misses"] == 1
+
+
+def test_second_ingest_refreshes_changed_articles(index, tmp_path):
+    updated = [
+        {"title": "Tokyo", "revision": 2, "text": "Tokyo is the capital of Japan, home to about 14 million people."},
+        ARTICLES[1],
+    ]
+    counts = index.ingest(write_jsonl(tmp_path / "update.jsonl", updated))
+
+    assert counts == {"inserted": 0, "updated": 1, "skipped": 1}
+    assert "14 million" in index.search("Tokyo")[0][1]
+    assert index.search("populous city") == []
+    assert index.get_stats()["articles"] == 2
+
+
+def test_extract_summary_strips_markup():
+    wikitext = "{{Infobox|name=x}}'''Tokyo''' is the [[Capital city|capital]] of [[Japan]].<ref>cite</ref>\n== History ==\nOld."
+    assert extract_summary(wikitext) == "Tokyo is the capital of Japan."
@@ -1,14 +1,16 @@
 """LangChain-compatible tools for the agent."""
 
-from typing import Optional, Type
+from typing import Callable, Optional, Tuple, Type
 from langchain_core.tools import BaseTool
 from langchain_core.callbacks import CallbackManagerForToolRun
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
 # Import custom tools
 from .web_search import web_search_tool
 from .calculator import calculator_tool  
 from .datetime_tool import datetime_tool
+from .wikipedia_index import WikipediaIndex, load_wikipedia_index
+from .resilience import FAILURE_PREFIXES, TOOL_TIMEOUTS, wrap_tools
 
 # Import native LangChain tools
 from langchain_community.tools import WikipediaQueryRun
@@ -16,6 +18,56 @@ from langchain_community.utilities import WikipediaAPIWrapper
 from langchain_community.tools import ArxivQueryRun
 from langchain_community.utilities import ArxivAPIWrapper
 from langchain_experimental.tools import PythonREPLTool
+from langchain_experimental.tools.python.tool import sanitize_input
+
+from utils.cassette import Cassette
+from utils.deadline import get_current_deadline
+from utils.shared_store import ResponseCache
+from utils.single_flight import SingleFlight
+
+
+# Seconds network-backed tool results are served from the shared cache
+TOOL_CACHE_TTL_S = 300
+
+# Identical concurrent queries to network-backed tools share one request
+tool_flight = SingleFlight()
+
+# Results shared across worker processes (see utils/shared_store.py)
+tool_cache = ResponseCache("tool", TOOL_CACHE_TTL_S)
+
+# Tools whose requests are shared, so a call started early is joined by the agent's own call
+PREFETCH_TOOLS = ("web_search", "wikipedia", "arxiv")
+
+# Python code is killed this long before its tool timeout, so the wrapper sees the kill reported
+PYTHON_KILL_MARGIN_S = 0.5
+
+# Optional record/replay cassette shared by all tool wrappers
+tool_cassette: Optional[Cassette] = None
+
+
+def set_tool_cassette(cassette: Optional[Cassette]) -> None:
+    """Record tool traffic to, or replay it from, a cassette (None disables)."""
+    global tool_cassette
+    tool_cassette = cassette
+
+
+def _call_tool(name: str, args: Tuple, fn: Callable[[], str], shareable: bool = True) -> str:
+    """
+    Run a tool request through the cassette (if set) or, for shareable
+    requests, the shared cache and single-flight.
+    
+    With a cassette every request goes to it: recording must capture each
+    query, and replayed sessions must not be served from each other's results.
+    """
+    if tool_cassette is not None:
+        return tool_cassette.call("tool", (name,) + args, fn)
+    if not shareable:
+        return fn()
+    return tool_cache.get_or_compute(
+        [name, *args],
+        lambda: tool_flight.do((name,) + args, fn),
+        cacheable=lambda result: not str(result).startswith(FAILURE_PREFIXES)
+    )
 
 
 # Custom tool wrappers (existing)
@@ -38,6 +90,13 @@ class WebSearchTool(BaseTool):
         run_manager: Optional[CallbackManagerForToolRun] = None
     ) -> str:
         """Execute web search."""
+        return _call_tool(
+            "web_search", (query, max_results),
+            lambda: self._search(query, max_results)
+        )
+    
+    def _search(self, query: str, max_results: int) -> str:
+        """Run the search and format results."""
         results = web_search_tool.search(query, max_results)
         
         # Format results for LangChain
@@ -72,8 +131,11 @@ class CalculatorTool(BaseTool):
         run_manager: Optional[CallbackManagerForToolRun] = None
     ) -> str:
         """Execute calculation."""
-        result = calculator_tool.calculate(expression)
-        return f"Result: {result}"
+        return _call_tool(
+            "calculator", (expression,),
+            lambda: f"Result: {calculator_tool.calculate(expression)}",
+            shareable=False
+        )
 
 
 class DateTimeInput(BaseModel):
@@ -96,8 +158,89 @@ class DateTimeTool(BaseTool):
         run_manager: Optional[CallbackManagerForToolRun] = None
     ) -> str:
         """Get current datetime."""
-        result = datetime_tool.get_current_datetime(format_type)
-        return f"Current datetime ({format_type}): {result}"
+        return _call_tool(
+            "get_datetime", (format_type,),
+            lambda: f"Current datetime ({format_type}): {datetime_tool.get_current_datetime(format_type)}",
+            shareable=False
+        )
+
+
+# Native tool subclasses routed through the cassette and single-flight
+class WikipediaTool(WikipediaQueryRun):
+    """Wikipedia tool backed by the offline index when available, with the online API as fallback."""
+
+    local_index: Optional[WikipediaIndex] = Field(default=None, exclude=True)
+
+    _index_checked: bool = PrivateAttr(default=False)
+
+    def _run(
+        self,
+        query: str,
+        run_manager: Optional[CallbackManagerForToolRun] = None
+    ) -> str:
+        """Execute Wikipedia lookup."""
+        return _call_tool(
+            "wikipedia", (query,),
+            lambda: self._lookup(query, run_manager)
+        )
+
+    def _lookup(self, query: str, run_manager: Optional[CallbackManagerForToolRun]) -> str:
+        """Serve from the local index, falling back to the online API on a miss or error."""
+        if self.local_index is None and not self._index_checked:
+            # Resolved on first use so WIKIPEDIA_INDEX_PATH from .env is picked up
+            self._index_checked = True
+            self.local_index = load_wikipedia_index()
+        if self.local_index is not None:
+            try:
+                result = self.local_index.run(query, top_k=self.api_wrapper.top_k_results)
+                if result:
+                    return result
+            except Exception:
+                # A broken or locked index must not take the tool down
+                pass
+        return super()._run(query, run_manager=run_manager)
+
+
+class ArxivTool(ArxivQueryRun):
+    """ArXiv tool that shares results of identical searches."""
+
+    def _run(
+        self,
+        query: str,
+        run_manager: Optional[CallbackManagerForToolRun] = None
+    ) -> str:
+        """Execute arXiv search."""
+        return _call_tool(
+            "arxiv", (query,),
+            lambda: super(ArxivTool, self)._run(query, run_manager=run_manager)
+        )
+
+
+class PythonTool(PythonREPLTool):
+    """
+    Python REPL tool; never shared or cached since executions have side effects.
+
+    Code runs in a child process that is killed at the tool's timeout (capped
+    by the request deadline): a thread cannot be stopped, so runaway code such
+    as ``while True: pass`` would otherwise hold a worker and the GIL forever.
+    Each run starts from the REPL's globals; its own assignments do not persist.
+    """
+
+    def _run(
+        self,
+        query: str,
+        run_manager: Optional[CallbackManagerForToolRun] = None
+    ) -> str:
+        """Execute Python code."""
+        deadline = get_current_deadline()
+        limit = TOOL_TIMEOUTS["Python_REPL"]
+        timeout = max((deadline.timeout(limit) if deadline else limit) - PYTHON_KILL_MARGIN_S, 0.1)
+        code = sanitize_input(query) if self.sanitize_input else query
+        return _call_tool(
+            "python_repl", (query,),
+            lambda: self.python_repl.run(code, timeout=timeout),
+            shareable=False
+        )
 
 
 # Create custom tool instances
@@ -106,17 +249,18 @@ langchain_calculator = CalculatorTool()
 langchain_datetime = DateTimeTool()
 
 # Create native LangChain tool instances
-wikipedia_tool = WikipediaQueryRun(api_wrapper=WikipediaAPIWrapper())
-arxiv_tool = ArxivQueryRun(api_wrapper=ArxivAPIWrapper())
-python_repl_tool = PythonREPLTool()
+# Set WIKIPEDIA_INDEX_PATH to an index built with `python -m tools.wikipedia_index ingest`
+wikipedia_tool = WikipediaTool(api_wrapper=WikipediaAPIWrapper())
+arxiv_tool = ArxivTool(api_wrapper=ArxivAPIWrapper())
+python_repl_tool = PythonTool()
 
 # Configure tool descriptions for better agent understanding
 wikipedia_tool.description = "Search Wikipedia for encyclopedic information about people, places, concepts, and historical events"
 arxiv_tool.description = "Search arXiv for academic papers and research publications in science, mathematics, computer science, and other fields"
 python_repl_tool.description = "Execute Python code to perform complex calculations, data analysis, or programming tasks. Use for computational problems that require more than basic math."
 
-# Export all tools list
-LANGCHAIN_TOOLS = [
+# Export all tools list, each with a deadline, circuit breaker and fallbacks
+LANGCHAIN_TOOLS = wrap_tools([
     # Custom tools
     langchain_web_search,
     langchain_calculator,
@@ -125,4 +269,4 @@ LANGCHAIN_TOOLS = [
     wikipedia_tool,
     arxiv_tool,
     python_repl_tool
-] 
\ No newline at end of file
+]) 
\ No newline at end of file
@@ -0,0 +1,334 @@
+"""Per-tool timeouts, circuit breakers and fallback chains."""
+
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from langchain_core.callbacks import CallbackManagerForToolRun
+from langchain_core.tools import BaseTool
+from pydantic import Field, PrivateAttr
+
+from utils.deadline import get_current_deadline, track
+
+
+# Per-tool deadlines in seconds
+TOOL_TIMEOUTS = {
+    "web_search": 8.0,
+    "wikipedia": 8.0,
+    "arxiv": 10.0,
+    "Python_REPL": 15.0,
+    "calculator": 2.0,
+    "get_datetime": 1.0,
+}
+DEFAULT_TOOL_TIMEOUT = 10.0
+
+# Tools tried in order when a tool fails, times out or its breaker is open
+TOOL_FALLBACKS = {
+    "web_search": ["wikipedia"],
+    "wikipedia": ["web_search"],
+    "arxiv": ["web_search"],
+}
+
+# Tool outputs that signal a failed call (the wrapped tools return errors as text)
+FAILURE_PREFIXES = ("Search failed", "Arxiv exception")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Shared worker pool; a call that overruns its deadline keeps its worker until it returns
+# (Python_REPL code runs in a child process that is killed at its timeout instead)
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="tool")
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker that fails fast after repeated failures.
+
+    Closed: calls pass through. After ``failure_threshold`` consecutive
+    failures it opens and rejects calls immediately. After ``reset_timeout``
+    seconds it goes half-open and lets a single probe through; the probe's
+    outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        """Initialize a closed breaker."""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._stats = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self) -> str:
+        """Current state, moving open to half-open once the reset timeout has passed."""
+        with self._lock:
+            return self._current_state()
+
+    def allow(self) -> bool:
+        """Check whether a call may proceed (claims the probe slot when half-open)."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    def record_success(self) -> None:
+        """Record a successful call and close the breaker."""
+        with self._lock:
+            self._stats["successes"] += 1
+            self._failures = 0
+            self._probe_in_flight = False
+            self._state = CLOSED
+
+    def release(self) -> None:
+        """Give back a half-open probe slot without recording an outcome."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        """Record a failed call, opening the breaker at the threshold or after a failed probe."""
+        with self._lock:
+            self._stats["failures"] += 1
+            self._failures += 1
+            probe_failed = self._probe_in_flight
+            self._probe_in_flight = False
+            if probe_failed or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._stats["opened"] += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get breaker state and counters."""
+        with self._lock:
+            return {"state": self._current_state(), **self._stats}
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+        return self._state
+
+
+class ToolTimeout(Exception):
+    """Raised when a tool call exceeds its deadline."""
+
+    def __init__(self, timeout: float):
+        super().__init__(f"timed out after {timeout:g}s")
+        self.timeout = timeout
+
+
+class ToolBusy(Exception):
+    """Raised when no pool worker picked up a tool call before its deadline."""
+
+
+class _UntrackedBreaker:
+    """Breaker stand-in for calls whose outcome another call records."""
+
+    def record_success(self) -> None:
+        pass
+
+    def record_failure(self) -> None:
+        pass
+
+    def release(self) -> None:
+        pass
+
+
+class ResilientTool(BaseTool):
+    """
+    Wrapper adding a deadline, a circuit breaker and fallbacks to a tool.
+
+    Keeps the wrapped tool's name, description and argument schema, so the
+    agent sees the same tool. Failures are returned as text observations,
+    like the wrapped tools do, rather than raised.
+    """
+
+    inner: BaseTool = Field(exclude=True)
+    timeout: float = DEFAULT_TOOL_TIMEOUT
+    breaker: CircuitBreaker = Field(default_factory=CircuitBreaker, exclude=True)
+    fallbacks: List[BaseTool] = Field(default_factory=list, exclude=True)
+
+    _stats: Dict[str, int] = PrivateAttr(
+        default_factory=lambda: {"calls": 0, "timeouts": 0, "busy": 0, "errors": 0, "fallbacks": 0, "prefetches": 0}
+    )
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @classmethod
+    def wrap(cls, tool: BaseTool, timeout: Optional[float] = None) -> "ResilientTool":
+        """Wrap a tool using its configured timeout from TOOL_TIMEOUTS."""
+        return cls(
+            inner=tool,
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            timeout=timeout if timeout is not None else TOOL_TIMEOUTS.get(tool.name, DEFAULT_TOOL_TIMEOUT),
+        )
+
+    def _run(
+        self,
+        *args: Any,
+        run_manager: Optional[CallbackManagerForToolRun] = None,
+        **kwargs: Any
+    ) -> str:
+        """Run the wrapped tool, falling back when it fails or is unavailable."""
+        self._count("calls")
+        result, error = self.call_protected(
+            lambda: self.inner._run(*args, run_manager=run_manager, **kwargs)
+        )
+        if error is None:
+            return result
+
+        query = str(args[0] if args else next(iter(kwargs.values()), ""))
+        for fallback in self.fallbacks:
+            fallback_result, fallback_error = fallback.call_protected(
+                lambda fallback=fallback: fallback.inner._run(query)
+            )
+            if fallback_error is None:
+                self._count("fallbacks")
+                return f"[{self.name} unavailable ({error}); results from {fallback.name}]\n{fallback_result}"
+        return f"{self.name} is unavailable: {error}"
+
+    def prefetch(self, query: str) -> Optional[Future]:
+        """
+        Start the wrapped tool in the background, ahead of the agent's own call.
+
+        Only useful for tools whose requests are shared through single-flight
+        and the response cache: the agent's call then joins the running request
+        or reads its result. Nothing is started unless the breaker is closed.
+        The call goes through ``call_protected``, so it keeps the tool's timeout
+        and the request deadline. Its outcome is not recorded: the agent's own
+        call for the same input records it, so one failed request counts once
+        against the breaker.
+
+        Returns:
+            Future of the (result, error) pair, or None if nothing was started
+        """
+        if self.breaker.state != CLOSED:
+            return None
+        self._count("prefetches")
+        return _executor.submit(
+            contextvars.copy_context().run,
+            self.call_protected,
+            lambda: self.inner._run(query),
+            False
+        )
+
+    def call_protected(self, fn: Callable[[], Any], record: bool = True) -> tuple:
+        """
+        Run a call through this tool's breaker and deadline.
+
+        Args:
+            fn: Performs the call
+            record: Record the outcome in the breaker and failure counters
+                (off for a prefetch, whose outcome the agent's own call records)
+
+        Returns:
+            (result, None) on success, or (None, reason) on failure
+        """
+        deadline = get_current_deadline()
+        if deadline is not None and deadline.timeout(self.timeout) <= 0:
+            return None, "request deadline exceeded"
+        if record and not self.breaker.allow():
+            return None, "circuit open"
+        breaker = self.breaker if record else _UntrackedBreaker()
+        count = self._count if record else (lambda key: None)
+        try:
+            with track(f"tool:{self.name}"):
+                result = self._with_timeout(fn)
+        except ToolBusy:
+            # Every worker was taken; says nothing about the tool's health
+            count("busy")
+            breaker.release()
+            return None, "no worker was free before the deadline"
+        except ToolTimeout as e:
+            count("timeouts")
+            if e.timeout < self.timeout:
+                # Cut short by the request deadline; says nothing about the tool's health
+                breaker.release()
+                return None, f"request deadline reached after {e.timeout:.1f}s"
+            breaker.record_failure()
+            return None, str(e)
+        except Exception as e:
+            count("errors")
+            breaker.record_failure()
+            return None, str(e)
+
+        if isinstance(result, str) and result.startswith(FAILURE_PREFIXES):
+            count("errors")
+            breaker.record_failure()
+            return None, result
+        breaker.record_success()
+        return result, None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get call counters and breaker state."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["breaker"] = self.breaker.get_stats()
+        return stats
+
+    def _with_timeout(self, fn: Callable[[], Any]) -> Any:
+        """
+        Run fn on the shared pool, timing it from when a worker picks it up.
+
+        The timeout is the tool's own, capped by the request deadline. Waiting
+        for a free worker is bounded the same way but raises ToolBusy instead,
+        so a saturated pool is not blamed on the tool.
+        """
+        deadline = get_current_deadline()
+        started = threading.Event()
+
+        def run() -> Any:
+            started.set()
+            return fn()
+
+        # Copy context variables so the call sees the caller's request context
+        future = _executor.submit(contextvars.copy_context().run, run)
+        queue_timeout = deadline.timeout(self.timeout) if deadline else self.timeout
+        if not started.wait(queue_timeout) and future.cancel():
+            raise ToolBusy()
+        timeout = deadline.timeout(self.timeout) if deadline else self.timeout
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise ToolTimeout(timeout)
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+
+def wrap_tools(
+    tools: Sequence[BaseTool],
+    fallbacks: Optional[Dict[str, List[str]]] = None
+) -> List[ResilientTool]:
+    """
+    Wrap tools with deadlines and circuit breakers and wire their fallback chains.
+
+    Args:
+        tools: Tools to wrap
+        fallbacks: Tool name -> fallback tool names (defaults to TOOL_FALLBACKS)
+
+    Returns:
+        Wrapped tools in the same order
+    """
+    wrapped = [ResilientTool.wrap(tool) for tool in tools]
+    by_name = {tool.name: tool for tool in wrapped}
+    chains = TOOL_FALLBACKS if fallbacks is None else fallbacks
+    for tool in wrapped:
+        tool.fallbacks = [by_name[name] for name in chains.get(tool.name, []) if name in by_name]
+    return wrapped
+
+
+def get_resilience_stats(tools: Sequence[BaseTool]) -> Dict[str, Any]:
+    """Get per-tool resilience counters and breaker states."""
+    return {tool.name: tool.get_stats() for tool in tools if isinstance(tool, ResilientTool)}
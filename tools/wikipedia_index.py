@@ -0,0 +1,348 @@
+"""Offline Wikipedia index: SQLite FTS5 over compressed article summaries."""
+
+import bz2
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    revision INTEGER NOT NULL DEFAULT 0,
+    summary BLOB NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+    title, summary, content='', tokenize='porter unicode61'
+);
+"""
+
+# Lead-section characters kept per article
+MAX_SUMMARY_CHARS = 1500
+
+# Wikitext cleanup patterns for lead-section extraction
+COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+REF_RE = re.compile(r"<ref[^>]*/>|<ref[^>]*>.*?</ref>", re.DOTALL | re.IGNORECASE)
+TAG_RE = re.compile(r"<[^>]+>")
+TABLE_RE = re.compile(r"\{\|.*?\|\}", re.DOTALL)
+FILE_LINK_RE = re.compile(r"\[\[(?:File|Image|Category):[^\[\]]*(?:\[\[[^\]]*\]\][^\[\]]*)*\]\]", re.IGNORECASE)
+LINK_RE = re.compile(r"\[\[(?:[^\]|]*\|)?([^\]]*)\]\]")
+EXTERNAL_LINK_RE = re.compile(r"\[https?://[^\s\]]+\s*([^\]]*)\]")
+EMPHASIS_RE = re.compile(r"'{2,}")
+HEADING_RE = re.compile(r"^=+.*?=+\s*$", re.MULTILINE)
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Query words that say nothing about which article is wanted
+QUERY_STOP_WORDS = frozenset("""
+a about an and are as at be by can could did do does for from give has have how i in
+is it its me my of on or please show should tell than that the their this to us was
+we were what when where which who whom whose why will with would you your
+""".split())
+
+
+def _strip_templates(text: str) -> str:
+    """Remove (possibly nested) {{...}} templates."""
+    out = []
+    depth = 0
+    i = 0
+    while i < len(text):
+        pair = text[i:i + 2]
+        if pair == "{{":
+            depth += 1
+            i += 2
+        elif pair == "}}" and depth:
+            depth -= 1
+            i += 2
+        else:
+            if not depth:
+                out.append(text[i])
+            i += 1
+    return "".join(out)
+
+
+def extract_summary(wikitext: str, max_chars: int = MAX_SUMMARY_CHARS) -> str:
+    """
+    Extract a plain-text summary from the lead section of an article's wikitext.
+
+    Args:
+        wikitext: Raw MediaWiki markup
+        max_chars: Maximum summary length
+
+    Returns:
+        Plain-text lead section, truncated at a sentence boundary when possible
+    """
+    lead = HEADING_RE.split(wikitext, maxsplit=1)[0]
+    text = COMMENT_RE.sub("", lead)
+    text = REF_RE.sub("", text)
+    text = _strip_templates(text)
+    text = TABLE_RE.sub("", text)
+    text = FILE_LINK_RE.sub("", text)
+    text = LINK_RE.sub(r"\1", text)
+    text = EXTERNAL_LINK_RE.sub(r"\1", text)
+    text = TAG_RE.sub("", text)
+    text = EMPHASIS_RE.sub("", text)
+    paragraphs = [" ".join(p.split()) for p in text.split("\n\n")]
+    text = "\n".join(p for p in paragraphs if p)
+    if len(text) > max_chars:
+        cut = text.rfind(". ", 0, max_chars)
+        text = text[:cut + 1] if cut > max_chars // 2 else text[:max_chars]
+    return text.strip()
+
+
+def _open_dump(path: str):
+    """Open a plain, .bz2 or .gz dump file in binary mode."""
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def iter_xml_dump(path: str) -> Iterator[Tuple[str, str, int]]:
+    """Yield (title, wikitext, revision id) for main-namespace, non-redirect pages of a MediaWiki XML dump."""
+    with _open_dump(path) as f:
+        for _, elem in ET.iterparse(f, events=("end",)):
+            if elem.tag.rpartition("}")[2] != "page":
+                continue
+            fields: Dict[str, Any] = {}
+            redirect = False
+            for child in elem.iter():
+                tag = child.tag.rpartition("}")[2]
+                if tag == "redirect":
+                    redirect = True
+                elif tag in ("title", "ns", "text") and tag not in fields:
+                    fields[tag] = child.text or ""
+                elif tag == "id":
+                    # The first <id> is the page id, the second the revision id
+                    key = "page_id" if "page_id" not in fields else "revision_id"
+                    fields.setdefault(key, child.text)
+            elem.clear()
+            text = fields.get("text", "")
+            if redirect or fields.get("ns", "0") != "0" or text.lstrip().upper().startswith("#REDIRECT"):
+                continue
+            yield fields.get("title", ""), text, int(fields.get("revision_id") or 0)
+
+
+def iter_jsonl_dump(path: str) -> Iterator[Tuple[str, str, int]]:
+    """Yield (title, wikitext or summary, revision) from a JSON Lines subset export."""
+    with _open_dump(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            text = record.get("text") or record.get("summary") or ""
+            yield record["title"], text, int(record.get("revision", 0))
+
+
+class WikipediaIndex:
+    """
+    Local, memory-mapped Wikipedia summary index.
+
+    Article summaries are stored zlib-compressed in SQLite and indexed with a
+    contentless FTS5 table, so lookups touch only the index pages plus a few
+    small blobs. The database is opened read-mostly with ``mmap_size`` so hot
+    pages are served from the OS page cache.
+    """
+
+    def __init__(self, db_path: str, mmap_size: int = 256 * 1024 * 1024):
+        """
+        Open (or create) an index.
+
+        Args:
+            db_path: SQLite database file
+            mmap_size: Bytes of the database file to memory-map
+        """
+        self.db_path = db_path
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's connection, in autocommit mode with explicit transactions (not shared across threads)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def ingest(self, path: str, batch_size: int = 1000) -> Dict[str, int]:
+        """
+        Ingest a dump, or refresh the index from a newer one.
+
+        Articles whose stored revision is at least as new as the dump's are
+        skipped, so re-running ingest on an updated dump only rewrites changed
+        articles.
+
+        Args:
+            path: MediaWiki XML dump (.xml, .xml.bz2, .xml.gz) or JSON Lines subset (.jsonl[.gz|.bz2])
+            batch_size: Articles per transaction
+
+        Returns:
+            Counts of inserted, updated and skipped articles
+        """
+        is_jsonl = ".jsonl" in os.path.basename(path)
+        records = iter_jsonl_dump(path) if is_jsonl else iter_xml_dump(path)
+        counts = {"inserted": 0, "updated": 0, "skipped": 0}
+        conn = self._connection()
+        pending = 0
+        conn.execute("BEGIN")
+        for title, text, revision in records:
+            summary = extract_summary(text)
+            if not title or not summary:
+                counts["skipped"] += 1
+                continue
+            counts[self._upsert(conn, title, summary, revision)] += 1
+            pending += 1
+            if pending >= batch_size:
+                conn.execute("COMMIT")
+                conn.execute("BEGIN")
+                pending = 0
+        conn.execute("COMMIT")
+        conn.execute("INSERT INTO articles_fts(articles_fts) VALUES('optimize')")
+        return counts
+
+    def _upsert(self, conn: sqlite3.Connection, title: str, summary: str, revision: int) -> str:
+        """Insert or update one article; return 'inserted', 'updated' or 'skipped'."""
+        row = conn.execute(
+            "SELECT id, revision, summary FROM articles WHERE title = ?", (title,)
+        ).fetchone()
+        blob = zlib.compress(summary.encode("utf-8"), 9)
+        if row is None:
+            cursor = conn.execute(
+                "INSERT INTO articles(title, revision, summary) VALUES (?, ?, ?)",
+                (title, revision, blob)
+            )
+            conn.execute(
+                "INSERT INTO articles_fts(rowid, title, summary) VALUES (?, ?, ?)",
+                (cursor.lastrowid, title, summary)
+            )
+            return "inserted"
+
+        article_id, stored_revision, stored_blob = row
+        if revision and stored_revision >= revision:
+            return "skipped"
+        # Contentless FTS5 deletes need the originally indexed values
+        old_summary = zlib.decompress(stored_blob).decode("utf-8")
+        if old_summary == summary:
+            return "skipped"
+        conn.execute(
+            "INSERT INTO articles_fts(articles_fts, rowid, title, summary) VALUES ('delete', ?, ?, ?)",
+            (article_id, title, old_summary)
+        )
+        conn.execute(
+            "UPDATE articles SET revision = ?, summary = ? WHERE id = ?",
+            (revision, blob, article_id)
+        )
+        conn.execute(
+            "INSERT INTO articles_fts(rowid, title, summary) VALUES (?, ?, ?)",
+            (article_id, title, summary)
+        )
+        return "updated"
+
+    def search(self, query: str, top_k: int = 3) -> List[Tuple[str, str]]:
+        """
+        Find the most relevant article summaries.
+
+        Args:
+            query: Free-text query
+            top_k: Maximum number of articles
+
+        Returns:
+            List of (title, summary) pairs, best match first
+        """
+        conn = self._connection()
+        results = []
+        exact = conn.execute(
+            "SELECT id, title, summary FROM articles WHERE title = ?", (query.strip(),)
+        ).fetchone()
+        if exact:
+            results.append(exact)
+
+        # Every significant query word must occur, so unrelated articles are not passed off as hits
+        tokens = [token for token in TOKEN_RE.findall(query) if token.lower() not in QUERY_STOP_WORDS]
+        if tokens and len(results) < top_k:
+            match = " AND ".join(f'"{token}"' for token in tokens)
+            rows = conn.execute(
+                """
+                SELECT a.id, a.title, a.summary FROM articles_fts f
+                JOIN articles a ON a.id = f.rowid
+                WHERE articles_fts MATCH ?
+                ORDER BY bm25(articles_fts, 10.0, 1.0)
+                LIMIT ?
+                """,
+                (match, top_k + 1)
+            ).fetchall()
+            seen = {row[0] for row in results}
+            results.extend(row for row in rows if row[0] not in seen)
+
+        with self._lock:
+            self._stats["hits" if results else "misses"] += 1
+        return [
+            (title, zlib.decompress(blob).decode("utf-8"))
+            for _, title, blob in results[:top_k]
+        ]
+
+    def run(self, query: str, top_k: int = 3, max_chars: int = 4000) -> Optional[str]:
+        """
+        Look up a query and format results like WikipediaAPIWrapper.run.
+
+        Returns:
+            Formatted summaries, or None when the index has no match
+        """
+        results = self.search(query, top_k)
+        if not results:
+            return None
+        text = "\n\n".join(f"Page: {title}\nSummary: {summary}" for title, summary in results)
+        return text[:max_chars]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and the number of indexed articles."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["articles"] = self._connection().execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+        return stats
+
+
+def load_wikipedia_index() -> Optional[WikipediaIndex]:
+    """Open the index named by WIKIPEDIA_INDEX_PATH, if it is set and exists."""
+    db_path = os.getenv("WIKIPEDIA_INDEX_PATH")
+    if not db_path or not os.path.exists(db_path):
+        return None
+    return WikipediaIndex(db_path)
+
+
+if __name__ == "__main__":
+    # Build, refresh or query an index:
+    #   python -m tools.wikipedia_index ingest enwiki-latest-pages-articles.xml.bz2 --db wiki.sqlite
+    #   python -m tools.wikipedia_index search "Alan Turing" --db wiki.sqlite
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Offline Wikipedia index")
+    parser.add_argument("command", choices=["ingest", "search"])
+    parser.add_argument("target", help="Dump path for ingest, query for search")
+    parser.add_argument("--db", default=os.getenv("WIKIPEDIA_INDEX_PATH", "wikipedia_index.sqlite"))
+    args = parser.parse_args()
+
+    index = WikipediaIndex(args.db)
+    if args.command == "ingest":
+        start = time.perf_counter()
+        counts = index.ingest(args.target)
+        print(f"Ingested {args.target} in {time.perf_counter() - start:.1f}s: {counts}")
+    else:
+        start = time.perf_counter()
+        result = index.run(args.target)
+        print(result or "No match")
+        print(f"\n({(time.perf_counter() - start) * 1000:.2f} ms)")
@@ -0,0 +1 @@
+# Utils package
\ No newline at end of file
@@ -0,0 +1,155 @@
+"""Record/replay cassettes for LLM and tool traffic."""
+
+import atexit
+import gzip
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+
+RECORD = "record"
+REPLAY = "replay"
+
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode when a request was never recorded."""
+
+
+class Cassette:
+    """
+    Capture request/response pairs with their original timings and serve them back.
+
+    A cassette is a gzip-compressed JSON Lines file. Each line is either an
+    interaction (``kind``, ``key``, ``request``, ``response``, ``elapsed``) or an
+    event such as a session question. In replay mode interactions are served
+    by key in recorded order (cycling when a key is requested more often than
+    it was recorded), after sleeping for the original latency multiplied by
+    ``latency_scale`` (0 disables the sleep).
+    """
+
+    def __init__(self, path: str, mode: str = RECORD, latency_scale: float = 1.0):
+        """
+        Open a cassette for recording or replay.
+
+        Args:
+            path: Cassette file path (gzip JSON Lines)
+            mode: 'record' to append traffic, 'replay' to serve it
+            latency_scale: Multiplier applied to recorded latencies on replay
+        """
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._interactions: Dict[str, List[dict]] = {}
+        self._cursors: Dict[str, int] = {}
+        self._events: List[dict] = []
+        self._stats = {"recorded": 0, "replayed": 0, "misses": 0}
+        self._file = None
+
+        if mode == REPLAY:
+            self._load()
+        else:
+            # Appending adds a gzip member; readers see one continuous stream
+            self._file = gzip.open(path, "at", encoding="utf-8")
+            atexit.register(self.close)
+
+    @property
+    def replaying(self) -> bool:
+        """Whether the cassette serves recorded traffic."""
+        return self.mode == REPLAY
+
+    def call(self, kind: str, request: Sequence[Any], fn: Callable[[], Any]) -> Any:
+        """
+        Run a request through the cassette.
+
+        Args:
+            kind: Traffic type, e.g. 'llm' or 'tool'
+            request: JSON-serializable request parts identifying the call
+            fn: Performs the live request; must return a JSON-serializable value
+
+        Returns:
+            The live response (record mode) or the recorded one (replay mode)
+        """
+        key = self._key(kind, request)
+        if self.replaying:
+            entry = self._next(key)
+            if entry is None:
+                with self._lock:
+                    self._stats["misses"] += 1
+                raise CassetteMiss(f"No recorded {kind} interaction for {list(request)[:2]}")
+            if self.latency_scale > 0:
+                time.sleep(entry["elapsed"] * self.latency_scale)
+            with self._lock:
+                self._stats["replayed"] += 1
+            return entry["response"]
+
+        start = time.perf_counter()
+        response = fn()
+        self._write({
+            "kind": kind,
+            "key": key,
+            "request": list(request),
+            "response": response,
+            "elapsed": round(time.perf_counter() - start, 4),
+        })
+        return response
+
+    def record_event(self, event: str, data: Dict[str, Any]) -> None:
+        """Record a non-request event (e.g. a session question) in record mode."""
+        if not self.replaying:
+            self._write({"event": event, "time": time.time(), **data})
+
+    def events(self, event: Optional[str] = None) -> List[dict]:
+        """Get recorded events in order, optionally filtered by event name."""
+        return [e for e in self._events if event is None or e["event"] == event]
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get recorded, replayed and miss counters."""
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self) -> None:
+        """Flush and close the cassette file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    @staticmethod
+    def _key(kind: str, request: Sequence[Any]) -> str:
+        payload = json.dumps([kind, list(request)], sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def _next(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entries = self._interactions.get(key)
+            if not entries:
+                return None
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+            return entries[cursor % len(entries)]
+
+    def _write(self, entry: dict) -> None:
+        line = json.dumps(entry, separators=(",", ":"), default=str)
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line + "\n")
+            self._file.flush()
+            if "key" in entry:
+                self._stats["recorded"] += 1
+
+    def _load(self) -> None:
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if "key" in entry:
+                    self._interactions.setdefault(entry["key"], []).append(entry)
+                else:
+                    self._events.append(entry)
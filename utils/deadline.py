@@ -0,0 +1,131 @@
+"""End-to-end request deadlines propagated through context variables."""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+
+# Assumed cost of one ReAct iteration (rate-limit pause, LLM call, tool call)
+# until the request has measured its own
+DEFAULT_ITERATION_ESTIMATE_S = 2.5
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when work is attempted after the request deadline has passed."""
+
+
+class Deadline:
+    """
+    Latency budget for one request, with accounting of where it went.
+
+    A deadline with ``budget_s=None`` never expires but still records spend,
+    so every request gets a budget report. Activate it with ``activate()``;
+    LLM and tool calls find it through ``get_current_deadline()``.
+    """
+
+    def __init__(self, budget_s: Optional[float] = None):
+        """Start the clock for a request with the given budget in seconds."""
+        self.budget_s = budget_s
+        self.start = time.monotonic()
+        self.best_effort = False
+        self._lock = threading.Lock()
+        self._spent: Dict[str, float] = {}
+        self._iteration_times = []
+        self._last_iteration = self.start
+
+    def elapsed(self) -> float:
+        """Seconds since the request started."""
+        return time.monotonic() - self.start
+
+    def remaining(self) -> float:
+        """Seconds left in the budget (infinite when there is no budget)."""
+        if self.budget_s is None:
+            return float("inf")
+        return self.budget_s - self.elapsed()
+
+    @property
+    def expired(self) -> bool:
+        """Whether the budget is used up."""
+        return self.remaining() <= 0
+
+    def check(self) -> None:
+        """Raise DeadlineExceeded if the budget is used up."""
+        if self.expired:
+            raise DeadlineExceeded(f"request deadline of {self.budget_s:g}s exceeded")
+
+    def timeout(self, limit: Optional[float] = None) -> Optional[float]:
+        """Get the smaller of a component timeout and the remaining budget (None if both unbounded)."""
+        remaining = self.remaining()
+        if limit is None:
+            return None if remaining == float("inf") else max(remaining, 0.0)
+        return max(min(limit, remaining), 0.0)
+
+    def mark_iteration(self) -> None:
+        """Record the end of an agent iteration."""
+        now = time.monotonic()
+        with self._lock:
+            self._iteration_times.append(now - self._last_iteration)
+            self._last_iteration = now
+
+    def iteration_estimate(self) -> float:
+        """Expected duration of the next iteration, from this request's iterations so far."""
+        with self._lock:
+            if not self._iteration_times:
+                return DEFAULT_ITERATION_ESTIMATE_S
+            return sum(self._iteration_times) / len(self._iteration_times)
+
+    def can_fit_iteration(self) -> bool:
+        """Whether another iteration is expected to finish within the budget."""
+        return self.remaining() >= self.iteration_estimate()
+
+    def spend(self, category: str, seconds: float) -> None:
+        """Attribute spent time to a category such as 'llm' or 'tool:web_search'."""
+        with self._lock:
+            self._spent[category] = self._spent.get(category, 0.0) + seconds
+
+    @contextmanager
+    def activate(self) -> Iterator["Deadline"]:
+        """Make this the current deadline for the enclosed block."""
+        token = _current_deadline.set(self)
+        try:
+            yield self
+        finally:
+            _current_deadline.reset(token)
+
+    def report(self) -> Dict[str, Any]:
+        """Get where the budget went."""
+        elapsed = self.elapsed()
+        with self._lock:
+            spent = {category: round(seconds, 3) for category, seconds in self._spent.items()}
+            iterations = len(self._iteration_times)
+        accounted = sum(spent.values())
+        return {
+            "budget_s": self.budget_s,
+            "elapsed_s": round(elapsed, 3),
+            "remaining_s": None if self.budget_s is None else round(self.remaining(), 3),
+            "iterations": iterations,
+            "best_effort": self.best_effort,
+            "spent_s": spent,
+            "other_s": round(max(elapsed - accounted, 0.0), 3),
+        }
+
+
+def get_current_deadline() -> Optional[Deadline]:
+    """Get the deadline of the request running in this context, if any."""
+    return _current_deadline.get()
+
+
+@contextmanager
+def track(category: str) -> Iterator[None]:
+    """Attribute the enclosed block's wall time to the current deadline, if any."""
+    deadline = get_current_deadline()
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        if deadline is not None:
+            deadline.spend(category, time.monotonic() - start)
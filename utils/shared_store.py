@@ -0,0 +1,304 @@
+"""Cross-process shared state: rate-limit slots and response caches."""
+
+import abc
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+class SharedStore(abc.ABC):
+    """
+    Interface for state shared by all worker processes on a host (or cluster).
+
+    Implementations must make ``reserve_slot`` atomic across every process
+    that uses the store. ``MemoryStore`` covers a single process and doubles
+    as a local stand-in for a networked store; ``SQLiteStore`` covers all
+    processes on one host. A networked backend (e.g. Redis) only needs to
+    implement these four methods and be installed with ``set_shared_store``.
+    """
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        """Get a cached JSON value, or None if missing or expired."""
+
+    @abc.abstractmethod
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        """Store a JSON-serializable value for ttl seconds."""
+
+    @abc.abstractmethod
+    def reserve_slot(self, name: str, interval: float, max_wait: Optional[float] = None) -> Optional[float]:
+        """
+        Reserve the next call slot of a rate limit shared by all processes.
+
+        Args:
+            name: Rate limit name
+            interval: Minimum seconds between consecutive slots
+            max_wait: Do not reserve a slot further away than this (None = no limit)
+
+        Returns:
+            Wall-clock time (time.time()) of the reserved slot, or None if it
+            would be more than max_wait away (nothing is reserved then)
+        """
+
+    @abc.abstractmethod
+    def push_back(self, name: str, until: float) -> None:
+        """Move a rate limit's next free slot to at least the given wall-clock time."""
+
+
+class MemoryStore(SharedStore):
+    """In-process store; also the local stand-in for a networked store."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[str, tuple] = {}
+        self._slots: Dict[str, float] = {}
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._values[key]
+                return None
+            return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            # Store serialized, like a real backend, so callers never share objects
+            self._values[key] = (json.dumps(value), time.time() + ttl)
+
+    def reserve_slot(self, name: str, interval: float, max_wait: Optional[float] = None) -> Optional[float]:
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._slots.get(name, 0.0))
+            if max_wait is not None and slot - now > max_wait:
+                return None
+            self._slots[name] = slot + interval
+            return slot
+
+    def push_back(self, name: str, until: float) -> None:
+        with self._lock:
+            self._slots[name] = max(self._slots.get(name, 0.0), until)
+
+
+class SQLiteStore(SharedStore):
+    """Store in a SQLite file shared by every process on the host."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS kv (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS slots (
+        name TEXT PRIMARY KEY,
+        next_at REAL NOT NULL
+    );
+    """
+
+    # Expired cache rows are purged once every this many writes
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str):
+        """Open (or create) the store file."""
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's connection, in autocommit mode with explicit transactions."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._connection().execute(
+            "SELECT value FROM kv WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO kv(key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), now + ttl)
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM kv WHERE expires_at < ?", (now,))
+
+    def reserve_slot(self, name: str, interval: float, max_wait: Optional[float] = None) -> Optional[float]:
+        conn = self._connection()
+        # IMMEDIATE takes the write lock up front, so read-modify-write is atomic across processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute("SELECT next_at FROM slots WHERE name = ?", (name,)).fetchone()
+            slot = max(now, row[0] if row else 0.0)
+            if max_wait is not None and slot - now > max_wait:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "INSERT OR REPLACE INTO slots(name, next_at) VALUES (?, ?)", (name, slot + interval)
+            )
+            conn.execute("COMMIT")
+            return slot
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def push_back(self, name: str, until: float) -> None:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                """
+                INSERT INTO slots(name, next_at) VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET next_at = MAX(next_at, excluded.next_at)
+                """,
+                (name, until)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class RateLimiter:
+    """Minimum-interval rate limiter whose schedule lives in a shared store."""
+
+    def __init__(self, name: str, interval: float = 1.0, store: Optional[SharedStore] = None):
+        """
+        Args:
+            name: Rate limit name (all processes using it share one quota)
+            interval: Minimum seconds between calls across all processes
+            store: Shared store holding the schedule (defaults to get_shared_store())
+        """
+        self.name = name
+        self.interval = interval
+        self._store = store
+
+    @property
+    def store(self) -> SharedStore:
+        """The backing store, resolved on first use so .env settings apply."""
+        return self._store or get_shared_store()
+
+    def wait(self, max_wait: Optional[float] = None) -> bool:
+        """
+        Block until this caller's slot.
+
+        Args:
+            max_wait: Longest acceptable wait (None = no limit)
+
+        Returns:
+            True once the slot is reached, False if it is further away than max_wait
+        """
+        slot = self.store.reserve_slot(self.name, self.interval, max_wait)
+        if slot is None:
+            return False
+        delay = slot - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    def back_off(self, seconds: float) -> None:
+        """Pause every process sharing this limit, e.g. after a quota (429) error."""
+        self.store.push_back(self.name, time.time() + seconds)
+
+
+class ResponseCache:
+    """TTL cache of JSON-serializable responses in a shared store."""
+
+    def __init__(self, namespace: str, ttl: float, store: Optional[SharedStore] = None):
+        """
+        Args:
+            namespace: Key prefix separating caches in one store
+            ttl: Seconds an entry stays valid
+            store: Shared store holding the entries (defaults to get_shared_store())
+        """
+        self.namespace = namespace
+        self.ttl = ttl
+        self._store = store
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def get_or_compute(
+        self,
+        request: Any,
+        compute: Callable[[], Any],
+        cacheable: Callable[[Any], bool] = lambda value: True
+    ) -> Any:
+        """
+        Return the cached response for a request, computing and storing it on a miss.
+
+        Args:
+            request: JSON-serializable request identity
+            compute: Produces the response on a miss
+            cacheable: Only responses it accepts are stored (e.g. not errors)
+        """
+        key = self._key(request)
+        cached = self.store.get(key)
+        if cached is not None:
+            self._count("hits")
+            return cached
+        self._count("misses")
+        value = compute()
+        if value is not None and cacheable(value):
+            self.store.set(key, value, self.ttl)
+        return value
+
+    @property
+    def store(self) -> SharedStore:
+        """The backing store, resolved on first use so .env settings apply."""
+        return self._store or get_shared_store()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get this process's hit and miss counters."""
+        with self._lock:
+            return dict(self._stats)
+
+    def _key(self, request: Any) -> str:
+        payload = json.dumps(request, sort_keys=True, default=str)
+        return f"{self.namespace}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+
+_shared_store: Optional[SharedStore] = None
+_shared_store_lock = threading.Lock()
+
+
+def get_shared_store() -> SharedStore:
+    """
+    Get the process-wide shared store.
+
+    Uses a SQLiteStore at AGENT_SHARED_STORE when that is set (all workers on
+    the host should point at the same file), otherwise an in-process MemoryStore.
+    """
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            path = os.getenv("AGENT_SHARED_STORE")
+            _shared_store = SQLiteStore(path) if path else MemoryStore()
+        return _shared_store
+
+
+def set_shared_store(store: SharedStore) -> None:
+    """Install a shared store backend, e.g. a networked one, before agents are created."""
+    global _shared_store
+    with _shared_store_lock:
+        _shared_store = store
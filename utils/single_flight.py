@@ -0,0 +1,127 @@
+"""Single-flight coalescing of identical in-flight calls."""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    """A call in flight that followers wait on."""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent calls into one underlying execution.
+    
+    The first caller for a key (the leader) runs the function; callers that
+    arrive with the same key while it is running wait for it and share its
+    result or exception. Nothing is cached: once the call completes, the next
+    caller for the key triggers a fresh execution.
+    
+    Results are shared between callers, so they must be treated as read-only.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._async_calls: Dict[Hashable, asyncio.Future] = {}
+        self._stats = {"calls": 0, "executions": 0, "coalesced": 0}
+    
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run fn once for all threads that request the same key concurrently.
+        
+        Args:
+            key: Hashable identity of the request
+            fn: Zero-argument callable performing the request
+            timeout: Longest a follower waits for the leader (None waits indefinitely)
+            
+        Returns:
+            The result of the shared execution
+            
+        Raises:
+            TimeoutError: If a follower's wait exceeds timeout
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["executions"] += 1
+                leader = True
+        
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError(f"Timed out waiting for in-flight call after {timeout:g}s")
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+    
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await fn once for all tasks on this event loop that request the same key.
+        
+        The shared execution runs as its own task, so cancelling any caller,
+        the one that started it included, leaves the others waiting on it.
+        
+        Args:
+            key: Hashable identity of the request
+            fn: Zero-argument callable returning an awaitable
+            
+        Returns:
+            The result of the shared execution
+        """
+        loop = asyncio.get_running_loop()
+        # Tasks are bound to their loop, so keys are scoped per loop
+        scoped_key = (id(loop), key)
+        with self._lock:
+            self._stats["calls"] += 1
+            task = self._async_calls.get(scoped_key)
+            if task is not None:
+                self._stats["coalesced"] += 1
+            else:
+                self._stats["executions"] += 1
+        
+        if task is None:
+            # No other task on this loop runs before the new one is registered
+            task = asyncio.ensure_future(fn())
+            with self._lock:
+                self._async_calls[scoped_key] = task
+            task.add_done_callback(lambda done: self._forget_async(scoped_key, done))
+        
+        # Shield so a cancelled caller does not cancel the shared execution
+        return await asyncio.shield(task)
+    
+    def _forget_async(self, scoped_key: tuple, task: "asyncio.Future") -> None:
+        """Drop a finished execution so the next caller starts a fresh one."""
+        with self._lock:
+            if self._async_calls.get(scoped_key) is task:
+                del self._async_calls[scoped_key]
+        if not task.cancelled():
+            # Mark retrieved so a failure nobody is left waiting for is not logged
+            task.exception()
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Get counters for calls, underlying executions and coalesced calls."""
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,83 @@
+"""Hashed lexical text vectors for fast local retrieval."""
+
+import re
+import zlib
+from typing import Iterable, Iterator, List
+
+import numpy as np
+
+
+# Words, plus arithmetic operators, which say a lot about what a question needs
+TOKEN_RE = re.compile(r"[a-z0-9]+|[+\-*/^%=]")
+
+# All numbers share one feature
+NUMBER_FEATURE = "<num>"
+
+# Words too common to say anything about relevance (question words are kept: they carry intent)
+STOP_WORDS = frozenset("""
+a an and are as at be by can could do does for from has have i in is it its me my
+of on or please should so than that the their them then there these this to we were
+what which will with would you your
+""".split())
+
+# Character n-grams let inflections match (e.g. "calculate" and "calculation")
+CHAR_NGRAM = 4
+CHAR_NGRAM_WEIGHT = 0.3
+
+
+class HashedTextVectorizer:
+    """
+    Maps text to L2-normalized vectors by feature hashing.
+
+    Features are the words of the text (minus stop words) plus character
+    n-grams of longer words, hashed into ``dim`` buckets with a random sign
+    so collisions cancel out on average. There is no vocabulary to fit, so
+    vectors can be computed incrementally and compared across processes;
+    the dot product of two vectors is their cosine similarity.
+    """
+
+    def __init__(self, dim: int = 1024):
+        """
+        Args:
+            dim: Number of hash buckets (vector length)
+        """
+        self.dim = dim
+
+    def transform(self, text: str) -> np.ndarray:
+        """Vectorize one text into a float32 vector of length dim (all zeros if it has no features)."""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(text):
+            hashed = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if (hashed >> 31) & 1 else -1.0
+            vector[hashed % self.dim] += sign * weight
+        norm = float(np.linalg.norm(vector))
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def transform_many(self, texts: Iterable[str]) -> np.ndarray:
+        """Vectorize texts into a (len(texts), dim) float32 matrix."""
+        rows: List[np.ndarray] = [self.transform(text) for text in texts]
+        if not rows:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.vstack(rows)
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        """Lowercase words of a text, without stop words."""
+        return [word for word in TOKEN_RE.findall(text.lower()) if word not in STOP_WORDS]
+
+    def _features(self, text: str) -> Iterator[tuple]:
+        for word in self.tokenize(text):
+            if word.isdigit():
+                yield f"w:{NUMBER_FEATURE}", 1.0
+                continue
+            yield f"w:{word}", 1.0
+            if len(word) > CHAR_NGRAM:
+                padded = f"<{word}>"
+                for start in range(len(padded) - CHAR_NGRAM + 1):
+                    yield f"c:{padded[start:start + CHAR_NGRAM]}", CHAR_NGRAM_WEIGHT
+
+
+# Shared vectorizer; vectors from different instances with the same dim are compatible
+text_vectorizer = HashedTextVectorizer()